@@ -39,12 +39,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # django's apps
     'django_filters',
     'rest_framework',
     'djoser',
-    'debug_toolbar',
 
     # my apps :
     'store.apps.StoreConfig',
@@ -52,7 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'core.metrics.MetricsMiddleware',
+    'core.db_routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +64,11 @@ MIDDLEWARE = [
 
 ]
 
+# debug_toolbar is only for development, /metrics (core.metrics) is what runs in production
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -99,9 +105,69 @@ DATABASES = {
 
         # 'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # a streaming replica of default, list it in DATABASE_REPLICAS to send reads to it
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.postgresql',
+    #     'NAME': 'postgres',
+    #     'USER': 'postgres',
+    #     'PASSWORD': 'postgres',
+    #     'HOST': 'db-replica',
+    #     'PORT': 5432,
+    #     'TEST': {'MIRROR': 'default'},
+    # },
+}
+
+# safe-method requests read from these aliases (core.db_routers), writes always go to default.
+# a client that just wrote reads from default for REPLICA_PIN_SECONDS,
+# a replica that can't be reached is skipped for REPLICA_RETRY_SECONDS
+DATABASE_ROUTERS = ['core.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+# a redis / memcached alias also pins API clients by their Authorization header, at the cost of a
+# cache lookup on every authenticated read. None pins through the cookie only
+REPLICA_PIN_CACHE_ALIAS = None
+REPLICA_RETRY_SECONDS = 30
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # seen by every worker process, for state a single process must not keep to itself.
+    # `manage.py createcachetable` creates its table, point it at redis / memcached when there is one
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    },
+    # 'default': {
+    #     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    #     'LOCATION': BASE_DIR / '.cache',
+    # },
+    # in memory and shared by every worker, for PERMISSION_CACHE_ALIAS (needs the redis package)
+    # 'redis': {
+    #     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    #     'LOCATION': 'redis://redis:6379/1',
+    # },
 }
 
+# cache alias and timeout (seconds) of the product catalog responses and of the catalog version
+# behind them and the catalog ETags, a cache every worker process shares (locmem is refused)
+CATALOG_CACHE_ALIAS = 'shared'
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# how store signals (order_created, ...) reach their receivers: 'outbox', 'thread' or 'sync'
+# the outbox is drained by `manage.py process_signal_outbox`
+SIGNAL_DISPATCH_MODE = 'outbox'
+SIGNAL_OUTBOX_RETRY_BASE_SECONDS = 5
+SIGNAL_OUTBOX_RETRY_MAX_SECONDS = 60 * 60
+
+# responses to POST /orders/ and /carts/<id>/items/ sent with an Idempotency-Key header are
+# replayed for this long (store.idempotency), `manage.py purge_idempotency_keys` deletes them after
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# carts idle (no cart or item write) for longer than this are deleted by `manage.py reap_stale_carts`
+CART_TTL = timedelta(days=30)
 
 
 # Password validation
@@ -150,16 +216,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     # 'PAGE_SIZE': 10,
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
     # ]
 }
 
+# product / order lists, order and cart details are serialized by the compiled
+# serializers of store.fast_serializers, set to False to use the DRF serializers
+FAST_SERIALIZATION = True
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT', ),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1)
@@ -168,6 +242,17 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'core.CustomUser'
 
+# has_perm() results are cached per user and invalidated by core.signals (core.backends).
+# the alias has to be a redis / memcached cache every worker shares (locmem and the db cache are
+# refused), None checks the permissions in the database like ModelBackend
+AUTHENTICATION_BACKENDS = ['core.backends.CachedModelBackend']
+PERMISSION_CACHE_ALIAS = None
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+
+# in-process cache of the user / customer rows behind JWT requests (core.authentication)
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 60
+
 
 DJOSER = {
     'SERIALIZERS': {
@@ -180,3 +265,10 @@ DJOSER = {
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# clients allowed to scrape /metrics
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+# gauges computed when /metrics is scraped
+METRICS_COLLECTORS = [
+    'store.signals.dispatch.outbox_metrics',
+]
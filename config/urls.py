@@ -14,9 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from core.metrics import metrics_view
+
 admin.site.site_header = 'Store'
 admin.site.index_title = 'Special Access'
 
@@ -26,6 +29,9 @@ urlpatterns = [
 
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')), 
-    
-    path("__debug__/", include("debug_toolbar.urls")),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+if settings.DEBUG:
+    urlpatterns.append(path("__debug__/", include("debug_toolbar.urls")))
@@ -0,0 +1,127 @@
+"""
+JWT authentication without a user query per request.
+
+CachedJWTAuthentication resolves the user id of the token through an in-process LRU cache
+holding a snapshot of the user row and its customer row (one joined query on a miss).
+request.user is a regular user instance built from that snapshot: the login fields are
+loaded, password / last_login / date_joined are deferred and only read when something
+needs them, and user.customer is already attached. entries expire after JWT_USER_CACHE_TTL
+seconds and core.signals drops them as soon as the user or the customer is saved
+in this process, the TTL bounds how long other processes may serve the old row.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from store.models import Customer
+
+
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active']
+
+
+class LRUCache:
+    """ a thread safe, size bounded mapping whose entries expire after `ttl` seconds """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = LRUCache(
+    maxsize=getattr(settings, 'JWT_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 60),
+)
+
+
+def get_user_fields():
+    # Model.from_db() expects the values in the order of the concrete fields
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname in USER_FIELDS]
+
+
+def get_customer_fields():
+    return [field.attname for field in Customer._meta.concrete_fields]
+
+
+def load_user_snapshot(user_id):
+    """ the user row and its customer row in one query, None when the user doesn't exist """
+    user_fields = get_user_fields()
+    lookups = user_fields + [f'customer__{field}' for field in get_customer_fields()]
+    row = get_user_model().objects.filter(pk=user_id).values_list(*lookups).first()
+    if row is None:
+        return None
+    user_values, customer_values = row[:len(user_fields)], row[len(user_fields):]
+    return user_values, (customer_values if customer_values[0] is not None else None)
+
+
+def get_cached_user(user_id):
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        snapshot = load_user_snapshot(user_id)
+        if snapshot is None:
+            return None
+        user_cache.set(user_id, snapshot)
+
+    # a new instance for every request, nothing mutable is shared between requests
+    user_values, customer_values = snapshot
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, get_user_fields(), user_values)
+    if customer_values is not None:
+        customer = Customer.from_db(DEFAULT_DB_ALIAS, get_customer_fields(), customer_values)
+        customer._state.fields_cache['user'] = user
+        user._state.fields_cache['customer'] = customer
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # revocation checks need the password hash, other id fields need another lookup
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD not in ('id', 'pk'):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,62 @@
+"""
+permission checks without queries in steady state.
+
+CachedModelBackend keeps the result of ModelBackend.get_all_permissions() in the cache
+under a key made of the user id, a per-user version and a global version.
+core.signals bumps the user version when the user, its groups or its own permissions
+change, and the global version when a group's permissions change or a group / permission
+is deleted. old entries are never read again and simply expire.
+settings.PERMISSION_CACHE_ALIAS has to be a redis / memcached cache: every worker has to see a
+revoke (no locmem) and every check has to stay off the database (no db cache).
+with PERMISSION_CACHE_ALIAS = None the backend is a plain ModelBackend.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+from .caches import bump_versions, get_shared_cache, get_versions
+
+
+GLOBAL_VERSION_KEY = 'perms-version'
+USER_VERSION_KEY = 'perms-version:{}'
+PERMISSIONS_KEY = 'perms:{}:{}:{}'
+
+
+def get_permission_cache():
+    if getattr(settings, 'PERMISSION_CACHE_ALIAS', None) is None:
+        return None
+    return get_shared_cache('PERMISSION_CACHE_ALIAS', None, allow_database=False)
+
+
+def bump_user_permissions_version(user_id):
+    cache = get_permission_cache()
+    if cache is not None:
+        bump_versions(cache, [USER_VERSION_KEY.format(user_id)])
+
+
+def bump_permissions_version():
+    cache = get_permission_cache()
+    if cache is not None:
+        bump_versions(cache, [GLOBAL_VERSION_KEY])
+
+
+def get_permissions_key(cache, user_id):
+    user_version_key = USER_VERSION_KEY.format(user_id)
+    versions = get_versions(cache, [GLOBAL_VERSION_KEY, user_version_key])
+    return PERMISSIONS_KEY.format(versions[GLOBAL_VERSION_KEY], versions[user_version_key], user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        cache = get_permission_cache()
+        if cache is None:
+            return super().get_all_permissions(user_obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            key = get_permissions_key(cache, user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60))
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
@@ -0,0 +1,65 @@
+"""
+caches shared by every worker process, used by the catalog cache (store.cache), the permission
+cache (core.backends) and the replica pins (core.db_routers). get_shared_cache() refuses the
+backends a process keeps to itself.
+
+a version is an opaque token stored under its own key, readers put it in the keys of the
+entries it covers and bumping it makes all of them stale at once. bumping writes a new
+token with set() instead of incr(), which most backends implement as a racy get + set.
+"""
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+
+def get_shared_cache(setting, default, allow_database=True):
+    """
+    the cache alias named by settings.<setting>, refused when the worker processes wouldn't share it
+    (locmem, dummy) or, with allow_database=False, when every lookup would be a query (the db cache).
+    """
+    alias = getattr(settings, setting, default)
+    cache = caches[alias]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(f"{setting} '{alias}' must be a cache shared by every worker process.")
+    if not allow_database and isinstance(cache, DatabaseCache):
+        raise ImproperlyConfigured(f"{setting} '{alias}' can't be a database cache, every lookup would be a query.")
+    return cache
+
+
+def new_version():
+    # unique across processes and restarts, so a flushed or evicted version never repeats
+    return f'{time.time_ns():x}{secrets.token_hex(4)}'
+
+
+def get_versions(cache, keys):
+    """ {key: version} of the given version keys, a missing one is started with a new version """
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_versions(cache, keys):
+    versions = {key: new_version() for key in keys}
+    cache.set_many(versions, None)
+    return versions
+
+
+def incr(cache, key):
+    """ a counter that starts at 0, for statistics, not for versions """
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key was evicted between add() and incr()
+        cache.set(key, 1, None)
+        return 1
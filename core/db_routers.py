@@ -0,0 +1,139 @@
+"""
+primary / replica database routing.
+
+PrimaryReplicaRouter sends every write to `default` and, only while a request handled by
+ReplicaRoutingMiddleware allows it, reads to one of settings.DATABASE_REPLICAS.
+a client that just wrote (any non safe method) is pinned to the primary for
+settings.REPLICA_PIN_SECONDS so it reads its own writes: browsers through a cookie,
+API clients through their Authorization header in the settings.REPLICA_PIN_CACHE_ALIAS cache.
+that cache is looked up on every authenticated read, so it has to be a redis / memcached one
+(locmem and the db cache are refused). it is off (None) by default, only the cookie pins then.
+the db cache table is always read from the primary, a version read from a lagging replica would be stale.
+a replica that can't be connected to is skipped for settings.REPLICA_RETRY_SECONDS.
+"""
+import random
+import time
+from contextvars import ContextVar
+from hashlib import md5
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .caches import get_shared_cache
+
+
+PIN_COOKIE_NAME = 'pin_primary'
+PIN_CACHE_KEY = 'replica-pin:{}'
+# app_label of the model django.core.cache.backends.db.DatabaseCache reads through the routers
+CACHE_TABLE_APP_LABEL = 'django_cache'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# reads go to the primary unless the current request allows replicas, so management commands,
+# shells and background threads always see the latest data
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# alias -> monotonic time until which the replica is considered down
+_unavailable = {}
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def mark_unavailable(alias):
+    _unavailable[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+
+
+def is_available(alias):
+    if _unavailable.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        mark_unavailable(alias)
+        return False
+    _unavailable.pop(alias, None)
+    return True
+
+
+def choose_replica():
+    replicas = get_replicas()
+    for alias in random.sample(replicas, len(replicas)):
+        if is_available(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block \
+                or model._meta.app_label == CACHE_TABLE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema through replication
+        return db not in get_replicas()
+
+
+def get_pin_cache():
+    if getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', None) is None:
+        return None
+    # a db cache would put a primary query in front of every read meant for a replica
+    return get_shared_cache('REPLICA_PIN_CACHE_ALIAS', None, allow_database=False)
+
+
+def get_pin_cache_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PIN_CACHE_KEY.format(md5(authorization.encode()).hexdigest())
+
+
+def is_pinned(request):
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE_NAME, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    cache, key = get_pin_cache(), get_pin_cache_key(request)
+    return cache is not None and key is not None and cache.get(key) is not None
+
+
+def pin(request, response):
+    pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+    response.set_cookie(PIN_COOKIE_NAME, f'{time.time() + pin_seconds:.0f}', max_age=pin_seconds,
+                        httponly=True, samesite='Lax')
+    cache, key = get_pin_cache(), get_pin_cache_key(request)
+    if cache is not None and key is not None:
+        cache.set(key, 1, pin_seconds)
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if get_replicas():
+            # a misconfigured pin cache fails at startup rather than on the first write
+            get_pin_cache()
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        token = _replica_reads.set(safe and not is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+        if not safe:
+            pin(request, response)
+        return response
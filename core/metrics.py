@@ -0,0 +1,189 @@
+"""
+lightweight per-route request metrics exposed in the prometheus text format.
+
+MetricsMiddleware records, for every resolved url name (product-list, order-detail, ...):
+latency histogram, request count by status, db query count and time, and the time spent
+in serializer.data + response rendering. the numbers live in process memory, so with
+several gunicorn workers every worker exposes its own series (scrape them all or sum them).
+the callables listed in settings.METRICS_COLLECTORS add gauges read at scrape time
+(e.g. the signal outbox depth and lag), those are the same in every worker.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('db_queries', 'db_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'latency_sum', 'statuses', 'db_queries', 'db_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency_sum = 0.0
+        self.statuses = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def observe(self, route, method, status, latency, request_metrics):
+        with self.lock:
+            stats = self.routes.get((route, method))
+            if stats is None:
+                stats = self.routes[(route, method)] = RouteStats()
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.count += 1
+            stats.latency_sum += latency
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.db_queries += request_metrics.db_queries
+            stats.db_seconds += request_metrics.db_seconds
+            stats.serialization_seconds += request_metrics.serialization_seconds
+
+    def render(self):
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = [
+                '# HELP http_request_duration_seconds Request latency by route.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (route, method), stats in routes:
+                labels = f'route="{route}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats.latency_sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+            lines += ['# HELP http_requests_total Requests by route and status.', '# TYPE http_requests_total counter']
+            for (route, method), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+            for name, attribute, help_text in [
+                ('db_queries_total', 'db_queries', 'Database queries run by route.'),
+                ('db_query_duration_seconds_total', 'db_seconds', 'Time spent in database queries by route.'),
+                ('serialization_duration_seconds_total', 'serialization_seconds',
+                 'Time spent in serializer.data and response rendering by route.'),
+            ]:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (route, method), stats in routes:
+                    value = getattr(stats, attribute)
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{route="{route}",method="{method}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _count_query(execute, sql, params, many, context):
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.db_queries += 1
+        request_metrics.db_seconds += time.perf_counter() - started
+
+
+def _timed_data(data_property):
+    def data(self):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            return data_property.fget(self)
+        started = time.perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            request_metrics.serialization_seconds += time.perf_counter() - started
+    data.timed = True
+    return property(data)
+
+
+def install_serializer_timing():
+    """ times the top level `serializer.data` calls, nested serializers are part of them """
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        data_property = serializer_class.__dict__['data']
+        if not getattr(data_property.fget, 'timed', False):
+            serializer_class.data = _timed_data(data_property)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_count_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name if match else None) or 'unresolved'
+        registry.observe(route, request.method, response.status_code, time.perf_counter() - started, request_metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, count that as serialization time
+        request_metrics = _current.get()
+        if request_metrics is not None and hasattr(response, 'render'):
+            render = response.render
+
+            def timed_render():
+                started = time.perf_counter()
+                try:
+                    return render()
+                finally:
+                    request_metrics.serialization_seconds += time.perf_counter() - started
+            response.render = timed_render
+        return response
+
+
+def metrics_view(request):
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', settings.INTERNAL_IPS)
+    if request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    lines = []
+    for collector in getattr(settings, 'METRICS_COLLECTORS', []):
+        lines += import_string(collector)()
+    body = registry.render() + ''.join(f'{line}\n' for line in lines)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,59 @@
-from django.dispatcher import receiver
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from core.authentication import user_cache
+from core.backends import bump_permissions_version, bump_user_permissions_version
+from store.models import Customer
 from store.signals import order_created
 
 
 @receiver(order_created)
-def after_oder_created(senderm, **kwargs):
-    print(f'New order is created {kwargs["order"].id}')
\ No newline at end of file
+def after_oder_created(sender, **kwargs):
+    print(f'New order is created {kwargs["order"].id}')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, raw=False, **kwargs):
+    user_cache.delete(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_cached_customer(sender, instance, raw=False, **kwargs):
+    user_cache.delete(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_permissions_on_save(sender, instance, raw=False, **kwargs):
+    # is_active / is_superuser change what get_all_permissions() returns
+    bump_user_permissions_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_user_permissions_version(instance.pk)
+    elif action == 'post_clear':
+        # the users of a cleared permission / group are not known anymore
+        bump_permissions_version()
+    else:
+        for user_id in pk_set:
+            bump_user_permissions_version(user_id)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_permissions_version()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_permissions_on_delete(sender, **kwargs):
+    bump_permissions_version()
@@ -1,3 +1,156 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .backends import get_permission_cache
+from .db_routers import PIN_COOKIE_NAME, ReplicaRoutingMiddleware
+
+# stands in for redis / memcached: shared by every process and no database query
+SHARED_CACHE = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()}
+
+# a second connection to the test database standing in for a streaming replica,
+# like the commented out `replica` alias of config/settings.py
+connections.settings['replica'] = {
+    **connections.settings['default'],
+    'TEST': {**connections.settings['default']['TEST'], 'MIRROR': 'default'},
+}
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'],
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': SHARED_CACHE,
+        'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'},
+    },
+    REPLICA_PIN_CACHE_ALIAS='shared',
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    # the mirror is another connection, it only sees committed rows
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user('reader', 'reader@example.com', 'password')
+
+    def read(self, request):
+        """ runs the request through the middleware, returns the alias the users were read from and the response """
+        read_from = []
+
+        def view(request):
+            if request.method == 'GET':
+                queryset = get_user_model().objects.all()
+                self.assertEqual(list(queryset), [self.user])
+                read_from.append(queryset.db)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return (read_from or [None])[0], response
+
+    def test_reads_outside_requests_go_to_the_primary(self):
+        self.assertEqual(router.db_for_read(get_user_model()), 'default')
+
+    def test_safe_requests_read_from_the_replica(self):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            alias, _ = self.read(self.factory.get('/'))
+        self.assertEqual(alias, 'replica')
+        self.assertEqual(len(queries), 1)
+
+    def test_reads_inside_a_transaction_go_to_the_primary(self):
+        def view(request):
+            with transaction.atomic():
+                return HttpResponse(router.db_for_read(get_user_model()))
+
+        self.assertEqual(ReplicaRoutingMiddleware(view)(self.factory.get('/')).content, b'default')
+
+    def test_writes_pin_the_client_through_the_cookie(self):
+        _, response = self.read(self.factory.post('/'))
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE_NAME] = response.cookies[PIN_COOKIE_NAME].value
+        self.assertEqual(self.read(request)[0], 'default')
+
+    def test_writes_pin_api_clients_through_the_shared_cache(self):
+        self.read(self.factory.post('/', HTTP_AUTHORIZATION='JWT token'))
+        self.assertEqual(self.read(self.factory.get('/', HTTP_AUTHORIZATION='JWT token'))[0], 'default')
+        self.assertEqual(self.read(self.factory.get('/', HTTP_AUTHORIZATION='JWT other'))[0], 'replica')
+
+    @override_settings(REPLICA_PIN_CACHE_ALIAS=None)
+    def test_without_a_pin_cache_only_the_cookie_pins(self):
+        _, response = self.read(self.factory.post('/', HTTP_AUTHORIZATION='JWT token'))
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.read(self.factory.get('/', HTTP_AUTHORIZATION='JWT token'))[0], 'replica')
+
+    def test_process_local_and_database_pin_caches_are_refused(self):
+        for alias in ('default', 'db'):
+            with self.subTest(alias=alias), override_settings(REPLICA_PIN_CACHE_ALIAS=alias), \
+                    self.assertRaises(ImproperlyConfigured):
+                ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    def test_the_cache_table_is_read_from_the_primary(self):
+        def view(request):
+            return HttpResponse(router.db_for_read(caches['db'].cache_model_class))
+
+        self.assertEqual(ReplicaRoutingMiddleware(view)(self.factory.get('/')).content, b'default')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}, 'shared': SHARED_CACHE},
+    PERMISSION_CACHE_ALIAS='shared',
+)
+class CachedModelBackendTests(TestCase):
+    """ grants and revokes are seen by the next permission check, wherever it runs """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('staff', 'staff@example.com', 'password')
+        self.permission = Permission.objects.get(content_type__app_label='store', codename='add_product')
+
+    def has_perm(self):
+        # a fresh user object, like the next request (or another worker) would load
+        return get_user_model().objects.get(pk=self.user.pk).has_perm('store.add_product')
+
+    def test_grant_and_revoke(self):
+        self.assertFalse(self.has_perm())
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        self.user.user_permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+    def test_group_grant_and_revoke(self):
+        group = Group.objects.create(name='editors')
+        self.user.groups.add(group)
+        self.assertFalse(self.has_perm())
+        group.permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        group.permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+    def test_warm_check_runs_no_query(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        user = get_user_model().objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('store.add_product'))
+
+    @override_settings(PERMISSION_CACHE_ALIAS=None)
+    def test_without_a_cache_permissions_come_from_the_database(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        self.user.user_permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+    def test_process_local_and_database_caches_are_refused(self):
+        caches_settings = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'},
+        }
+        for alias in caches_settings:
+            with self.subTest(alias=alias), override_settings(CACHES=caches_settings, PERMISSION_CACHE_ALIAS=alias), \
+                    self.assertRaises(ImproperlyConfigured):
+                get_permission_cache()
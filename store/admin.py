@@ -2,9 +2,12 @@ from django.contrib import admin, messages
 from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.http import urlencode
-from django.db.models import Count
+from django.db.models.functions import Now
+
+from core.admin_tools import AutocompleteFilter, AutocompleteFilterAdminMixin, EstimatedCountAdminMixin, ListSelectRelatedAdminMixin
 
 from . import models
+from .cache import bump_catalog_version
 
 
 class InventoryFilter(admin.SimpleListFilter):
@@ -32,8 +35,8 @@ class InventoryFilter(admin.SimpleListFilter):
 
 
 @admin.register(models.Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('title','unit_price','description','slug','product_category',
+class ProductAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('title','unit_price','final_price','description','slug','product_category',
                     'inventory','inventory_status','num_of_comments','datetime_created',
                     'datetime_modified', )
     list_display_order = 10
@@ -48,15 +51,11 @@ class ProductAdmin(admin.ModelAdmin):
     autocomplete_fields = ['category', 'discounts']
     authenticate_fiels = ['title']
 
-    def get_queryset(self, request):
-        return super().get_queryset(request)\
-            .prefetch_related('comments').annotate(
-                comments_count=Count('comments'),
-            )
-
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        update_count = queryset.update(inventory=0)
+        update_count = queryset.update(inventory=0, datetime_modified=Now())
+        # queryset.update() does not send post_save, so the catalog cache has to be invalidated here
+        bump_catalog_version()
         self.message_user(
             request,
             f'{update_count} of products inventories cleared to zero.',
@@ -75,33 +74,34 @@ class ProductAdmin(admin.ModelAdmin):
     def product_category(self, product):
         return product.category.title
 
-    @admin.display(description='# comments', ordering='comments_count')
+    @admin.display(description='# approved comments', ordering='comments_count')
     def num_of_comments(self, product):
         url = (
             reverse('admin:store_comment_changelist') 
             + '?'
             + urlencode({
                 'product__id': product.id,
+                'status__exact': models.Comment.COMMENT_STATUS_APPROVED,
             })
         )
         return format_html('<a href="{}">{}</a>', url, product.comments_count)
         
 
 @admin.register(models.Discount)
-class DiscounttAdmin(admin.ModelAdmin):
+class DiscounttAdmin(ListSelectRelatedAdminMixin, admin.ModelAdmin):
     list_display = ['title','discount','description']
     search_fields = ['title',]
 
 
 @admin.register(models.Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ListSelectRelatedAdminMixin, admin.ModelAdmin):
     list_display = ['title','description','top_product']
     search_fields = ['title']
 
 
 
 @admin.register(models.Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ['user','product','body','datetime_created','status']
     list_editable = ['status',]
     list_per_page = 10
@@ -109,6 +109,7 @@ class CommentAdmin(admin.ModelAdmin):
     authenticate_fiels = ['body']
     actions = ['make_status_to_approve',]
     list_select_related = ['product']
+    list_filter = ['status']
     search_fields = ['product__title']
 
 
@@ -117,14 +118,17 @@ class CommentAdmin(admin.ModelAdmin):
 
     @admin.action(description='make status to approve')
     def make_status_to_approve(self, request, queryset):
-        update_status = queryset.update(status='a')
+        # queryset.update() does not send post_save, so the comment counters are recomputed here
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        update_status = queryset.update(status=models.Comment.COMMENT_STATUS_APPROVED)
+        models.Product.refresh_comments_count(models.Product.objects.filter(pk__in=product_ids))
         self.message_user(request, f'{update_status} comment Approved')
 
 
 
 
 @admin.register(models.Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ListSelectRelatedAdminMixin, admin.ModelAdmin):
     list_display = ['user','first_name', 'last_name','phone_number','birth_date']
     search_fields = ['user__username', 'user__first_name', 'user__last_name']
     list_per_page = 10
@@ -143,7 +147,7 @@ class CustomerAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.Address)
-class AddressAdmin(admin.ModelAdmin):
+class AddressAdmin(ListSelectRelatedAdminMixin, admin.ModelAdmin):
     list_display = ['customer','province','city','street']
 
 
@@ -157,8 +161,8 @@ class OrderItemsInline(admin.TabularInline):
 
 
 @admin.register(models.Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id','customer','status','num_of_items', 'datetime_created', ]
+class OrderAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, AutocompleteFilterAdminMixin, admin.ModelAdmin):
+    list_display = ['id','customer','status','item_count', 'total_price', 'datetime_created', ]
     list_editable = ['status',]
     list_per_page = 10
     ordering = ['-datetime_created']
@@ -167,25 +171,14 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['id','customer__user__username','customer__user__first_name',
     'customer__user__last_name','customer__user__email','customer__phone_number']
     autocomplete_fields = ['customer', ]
-    list_filter = ['datetime_created', 'status', 'customer']
-
-    def get_queryset(self, request):
-        return super()\
-            .get_queryset(request)\
-            .prefetch_related('items')\
-            .annotate(
-                items_count=Count('items')
-            )
-
-    def num_of_items(self, order):
-        return order.items_count
+    list_filter = ['datetime_created', 'status', ('customer', AutocompleteFilter)]
 
 
 @admin.register(models.OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, AutocompleteFilterAdminMixin, admin.ModelAdmin):
     list_display = ['order','product','quantity','unit_price']
     search_fields = ['order']
-    list_filter = ['order','product',]
+    list_filter = [('order', AutocompleteFilter), ('product', AutocompleteFilter)]
 
 
 class CartItemInline(admin.TabularInline):
@@ -196,7 +189,7 @@ class CartItemInline(admin.TabularInline):
     autocomplete_fields = ['product',]
 
 @admin.register(models.Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ['id','created_at']
     inlines = [CartItemInline]
     search_fields = ['id','created_at']
@@ -204,6 +197,6 @@ class CartAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(ListSelectRelatedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ['cart','product','quantity']
 
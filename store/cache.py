@@ -0,0 +1,181 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from core.caches import bump_versions, get_shared_cache, get_versions, incr
+
+from .sparse_fields import FIELDS_PARAM, OMIT_PARAM
+
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+CATALOG_HITS_KEY = 'store:catalog:hits'
+CATALOG_MISSES_KEY = 'store:catalog:misses'
+INVENTORY_VERSION_KEY = 'store:catalog:inventory-version'
+PRODUCT_INVENTORY_VERSION_KEY = 'store:catalog:inventory-version:{}'
+
+
+def get_catalog_cache():
+    # every worker has to see a bump, or the others keep serving (and 304-ing) the old catalog
+    return get_shared_cache('CATALOG_CACHE_ALIAS', 'shared')
+
+
+def get_catalog_version():
+    return get_versions(get_catalog_cache(), [CATALOG_VERSION_KEY])[CATALOG_VERSION_KEY]
+
+
+def bump_catalog_version():
+    """ makes every cached catalog response (and catalog ETag) stale """
+    return bump_versions(get_catalog_cache(), [CATALOG_VERSION_KEY])[CATALOG_VERSION_KEY]
+
+
+def bump_inventory_versions(product_ids):
+    """ makes stale only the cached catalog responses (and ETags) that depend on the inventory of these products """
+    keys = [INVENTORY_VERSION_KEY] + [PRODUCT_INVENTORY_VERSION_KEY.format(pk) for pk in product_ids]
+    bump_versions(get_catalog_cache(), keys)
+
+
+def get_request_variant(view, request):
+    """ a digest of everything besides the data that changes the response of a GET """
+    query = sorted(request.query_params.lists())
+    query_string = '&'.join(f'{key}={",".join(values)}' for key, values in query)
+    variant = '|'.join([
+        request.get_host(),
+        request.accepted_renderer.format,
+        getattr(request, 'LANGUAGE_CODE', ''),
+        str(view.kwargs.get(view.lookup_url_kwarg or view.lookup_field, '')),
+        query_string,
+    ])
+    return hashlib.md5(variant.encode()).hexdigest()
+
+
+def get_catalog_cache_stats():
+    cache = get_catalog_cache()
+    values = cache.get_many([CATALOG_HITS_KEY, CATALOG_MISSES_KEY])
+    return {
+        'version': get_catalog_version(),
+        'hits': values.get(CATALOG_HITS_KEY, 0),
+        'misses': values.get(CATALOG_MISSES_KEY, 0),
+    }
+
+
+class CatalogVersionMixin:
+    """
+    the versions a catalog response depends on: the catalog version and, when the response shows
+    one of catalog_inventory_fields or filters / orders by it, the inventory version (of the product for retrieve).
+    a checkout only bumps the inventory versions, the responses without stock in them stay valid.
+    """
+    catalog_inventory_fields = ()
+
+    def depends_on_inventory(self, request):
+        params = [
+            part for key, values in request.query_params.lists() if key not in (FIELDS_PARAM, OMIT_PARAM)
+            for part in [key, *values]
+        ]
+        is_field_requested = getattr(self, 'is_field_requested', lambda name: True)
+        return any(
+            is_field_requested(name) or any(name in param for param in params)
+            for name in self.catalog_inventory_fields
+        )
+
+    def get_catalog_version_tag(self, request):
+        keys = [CATALOG_VERSION_KEY]
+        if self.depends_on_inventory(request):
+            if self.action == 'retrieve':
+                keys.append(PRODUCT_INVENTORY_VERSION_KEY.format(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+            else:
+                keys.append(INVENTORY_VERSION_KEY)
+        versions = get_versions(get_catalog_cache(), keys)
+        return '-'.join(versions[key] for key in keys)
+
+
+class CatalogCacheMixin(CatalogVersionMixin):
+    """
+    caches list and retrieve responses of anonymous GET requests.
+    the key contains the catalog version tag, so bumping the catalog version invalidates everything at once.
+    """
+    catalog_cache_timeout = None
+
+    def get_catalog_cache_key(self, request):
+        version_tag = self.get_catalog_version_tag(request)
+        return f'store:catalog:{version_tag}:{self.basename}:{self.action}:{get_request_variant(self, request)}'
+
+    def is_catalog_cacheable(self, request):
+        return request.method == 'GET' and not request.user.is_authenticated
+
+    def cached_catalog_response(self, request, view_method, *args, **kwargs):
+        if not self.is_catalog_cacheable(request):
+            return view_method(request, *args, **kwargs)
+
+        cache = get_catalog_cache()
+        key = self.get_catalog_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            incr(cache, CATALOG_HITS_KEY)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        incr(cache, CATALOG_MISSES_KEY)
+        response = view_method(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.catalog_cache_timeout
+            if timeout is None:
+                timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 15)
+            cache.set(key, response.data, timeout=timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_catalog_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_catalog_response(request, super().retrieve, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    answers If-None-Match / If-Modified-Since with 304 before any serialization happens.
+    views wrap their GET actions with conditional_response() and provide the validators
+    with get_etag() and get_last_modified(), both should be cheap (a version number, a single indexed column).
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_etag(self, request):
+        return None
+
+    def get_last_modified(self, request):
+        return None
+
+    def conditional_response(self, request, view_method, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return view_method(request, *args, **kwargs)
+
+        etag = self.get_etag(request)
+        etag = quote_etag(etag) if etag else None
+        last_modified = self.get_last_modified(request)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view_method(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class CatalogConditionalGetMixin(CatalogVersionMixin, ConditionalGetMixin):
+    """ catalog ETags come from the catalog version tag, checking them costs no database query """
+
+    def get_etag(self, request):
+        return f'{self.get_catalog_version_tag(request)}-{get_request_variant(self, request)}'
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,47 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """ a file-like object for csv.writer that returns the line instead of buffering it """
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(header, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def export_response(request, filename, header, rows):
+    """
+    streams `rows` (an iterable of tuples in `header` order) as csv or ndjson,
+    the format comes from the `export_format` query param.
+    """
+    export_format = request.query_params.get('export_format', 'csv')
+    if export_format not in EXPORT_CONTENT_TYPES:
+        raise ValidationError({'export_format': f'Choose one of {", ".join(EXPORT_CONTENT_TYPES)}.'})
+
+    lines = csv_lines(header, rows) if export_format == 'csv' else ndjson_lines(header, rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,118 @@
+"""
+compiled, read-only serializers.
+
+compile_serializer() turns a (bound) DRF serializer into a plain function instance -> dict that
+gives exactly the same output as serializer.to_representation(), without the per-row field
+machinery: model columns are read with attrgetter, primary key relations read the `<name>_id`
+column, char / integer fields are converted inline and every other field still goes through
+its own to_representation().
+"""
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.fields import get_attribute
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+
+def _identity(value):
+    return value
+
+
+def _model_column_getter(serializer, attrs):
+    """ attrgetter for a concrete, non relational column of the serializer model, otherwise None """
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None or len(attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(attrs[0])
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.is_relation:
+        return None
+    return attrgetter(model_field.attname)
+
+
+def _compile_field(serializer, field):
+    """ returns (getter, converter), the converter is skipped for None like DRF does """
+    if isinstance(field, serializers.SerializerMethodField):
+        return _identity, getattr(serializer, field.method_name)
+
+    if field.source == '*':
+        getter = _identity
+    else:
+        getter = _model_column_getter(serializer, field.source_attrs)
+        if getter is None:
+            source_attrs = field.source_attrs
+            getter = lambda instance: get_attribute(instance, source_attrs)  # noqa: E731
+
+    if isinstance(field, serializers.ListSerializer):
+        to_dict = compile_serializer(field.child)
+
+        def many(related):
+            # a related manager, like ListSerializer.to_representation uses .all() to hit the prefetch cache
+            iterable = related.all() if isinstance(related, models.manager.BaseManager) else related
+            return [to_dict(item) for item in iterable]
+        return getter, many
+
+    if isinstance(field, serializers.BaseSerializer):
+        return getter, compile_serializer(field)
+
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None and len(field.source_attrs) == 1:
+        return attrgetter(f'{field.source_attrs[0]}_id'), _identity
+
+    if type(field).to_representation is serializers.CharField.to_representation:
+        return getter, str
+    if type(field).to_representation is serializers.IntegerField.to_representation:
+        return getter, int
+
+    return getter, field.to_representation
+
+
+def compile_serializer(serializer):
+    plan = [
+        (field.field_name, *_compile_field(serializer, field))
+        for field in serializer._readable_fields
+    ]
+
+    def to_dict(instance):
+        ret = {}
+        for name, getter, converter in plan:
+            value = getter(instance)
+            ret[name] = None if value is None else converter(value)
+        return ret
+
+    return to_dict
+
+
+class FastSerializationMixin:
+    """ switch of the compiled serializers, settings.FAST_SERIALIZATION = False turns them off """
+
+    def use_fast_serialization(self):
+        return getattr(settings, 'FAST_SERIALIZATION', True)
+
+    def get_compiled_serializer(self):
+        return compile_serializer(self.get_serializer())
+
+
+class FastListMixin(FastSerializationMixin):
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serialization():
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        to_dict = self.get_compiled_serializer()
+        if page is not None:
+            return self.get_paginated_response([to_dict(instance) for instance in page])
+        return Response([to_dict(instance) for instance in queryset])
+
+
+class FastRetrieveMixin(FastSerializationMixin):
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_serialization():
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.get_compiled_serializer()(self.get_object()))
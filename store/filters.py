@@ -1,10 +1,50 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 from django_filters.rest_framework import FilterSet
+from rest_framework.filters import SearchFilter
 
-from .models import Product
+from .models import Order, Product
 
 class ProductFilter(FilterSet):
     class Meta:
         model = Product
         fields = {
             'inventory': ['gt', 'lt', ],
+            'final_price': ['gt', 'lt', ],
         }
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'status': ['exact', ],
+            'total_price': ['gt', 'lt', ],
+        }
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    full-text search over the GIN-indexed Product.search_vector (title + description),
+    OR-ed with a pg_trgm word similarity match on title for typos and partial words.
+    results are ranked by relevance unless the client asks for another ordering.
+    the tsvector is only used in the WHERE and the rank, Product.objects keeps it out of the SELECT.
+    """
+    search_config = 'english'
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        text = ' '.join(search_terms)
+        query = SearchQuery(text, search_type='websearch', config=self.search_config)
+
+        return queryset\
+            .filter(Q(search_vector=query) | Q(title__trigram_word_similar=text))\
+            .annotate(rank=Greatest(
+                SearchRank(F('search_vector'), query),
+                TrigramWordSimilarity(text, 'title'),
+            ))\
+            .order_by('-rank', 'id')
@@ -0,0 +1,95 @@
+"""
+Idempotency-Key support for create endpoints.
+
+the first response to a (scope, key) pair is stored in the IdempotencyKey table and
+replayed for every retry until settings.IDEMPOTENCY_KEY_TTL expires, the view doesn't run again.
+the key row is inserted in the same transaction as the view's writes, so a concurrent
+duplicate blocks on the unique index until the first request commits (and then replays)
+or rolls back (and then runs itself). failed requests (exceptions, 5xx) are not stored.
+"""
+import json
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def get_idempotency_key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def get_fingerprint(request):
+    digest = sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def purge_expired_idempotency_keys(batch_size=1000):
+    """ deletes expired keys in bounded batches """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+class IdempotencyMixin:
+    """
+    views wrap their create actions with idempotent_response() and provide get_idempotency_scope(),
+    so the keys of different clients never collide.
+    """
+
+    def get_idempotency_scope(self, request):
+        raise NotImplementedError
+
+    def idempotent_response(self, request, view_method, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view_method(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({IDEMPOTENCY_HEADER: f'must be 1 to {MAX_KEY_LENGTH} characters long.'})
+
+        fingerprint = get_fingerprint(request)
+        now = timezone.now()
+        with transaction.atomic():
+            record, created = IdempotencyKey.objects.select_for_update().get_or_create(
+                scope=self.get_idempotency_scope(request),
+                key=key,
+                defaults={'fingerprint': fingerprint, 'expires_at': now + get_idempotency_key_ttl()},
+            )
+            if not created and record.expires_at <= now:
+                record.fingerprint, record.status_code, record.response_body = fingerprint, None, ''
+                record.expires_at = now + get_idempotency_key_ttl()
+            elif record.fingerprint != fingerprint:
+                return Response(
+                    {'detail': f'This {IDEMPOTENCY_HEADER} was already used with another request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            elif record.status_code is not None:
+                data = json.loads(record.response_body) if record.response_body else None
+                return Response(data, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+            response = view_method(request, *args, **kwargs)
+            if response.status_code < 500:
+                record.status_code = response.status_code
+                # encoded like the JSON renderer does, so the replay renders the same bytes
+                record.response_body = json.dumps(response.data, cls=JSONEncoder, separators=(',', ':'))
+                record.save()
+            return response
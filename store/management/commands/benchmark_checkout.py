@@ -0,0 +1,81 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+
+from store.models import Cart, CartItem, Category, Order, OrderItem, Product
+from store.serializers import OrderCreateSerializer
+
+
+BENCH_PREFIX = 'bench_checkout'
+
+
+class Command(BaseCommand):
+    help = "Measures checkout throughput with many concurrent orders of the same hot products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--hot-products', type=int, default=5, help='every cart contains all of these products')
+        parser.add_argument('--inventory', type=int, default=None, help='initial inventory of each hot product')
+
+    def handle(self, *args, **options):
+        num_orders = options['orders']
+        inventory = options['inventory'] if options['inventory'] is not None else num_orders
+
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(username=BENCH_PREFIX, defaults={'email': f'{BENCH_PREFIX}@example.com'})
+        category = Category.objects.create(title=BENCH_PREFIX)
+        products = [
+            Product.objects.create(title=f'{BENCH_PREFIX} {i}', slug=BENCH_PREFIX, unit_price=10,
+                                   inventory=inventory, category=category)
+            for i in range(options['hot_products'])
+        ]
+        carts = Cart.objects.bulk_create([Cart() for _ in range(num_orders)])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1) for cart in carts for product in products
+        ])
+
+        latencies = []
+        rejected = []
+        lock = threading.Lock()
+
+        def checkout(cart):
+            started = time.perf_counter()
+            serializer = OrderCreateSerializer(data={'cart_id': str(cart.id)}, context={'user_id': user.id})
+            serializer.is_valid(raise_exception=True)
+            try:
+                serializer.save()
+            except ValidationError:
+                with lock:
+                    rejected.append(cart.id)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(checkout, carts))
+        elapsed = time.perf_counter() - started
+
+        remaining = list(Product.objects.filter(pk__in=[p.pk for p in products]).values_list('inventory', flat=True))
+        latencies.sort()
+        self.stdout.write(
+            f"{num_orders} checkouts with {options['threads']} threads in {elapsed:.2f}s "
+            f"({num_orders / elapsed:,.1f} orders/s)\n"
+            f"latency p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms\n"
+            f"rejected for inventory: {len(rejected)}, remaining inventory: {remaining}"
+        )
+
+        OrderItem.objects.filter(product__in=products).delete()
+        Order.objects.filter(customer__user=user, items__isnull=True).delete()
+        Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+        Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+        category.delete()
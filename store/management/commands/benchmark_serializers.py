@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from store.fast_serializers import compile_serializer
+from store.models import Cart, CartItem, Order, OrderItem, Product
+from store.renderers import ORJSONRenderer
+from store.serializers import CartSerilizer, OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares rows/s of the DRF serializers + JSONRenderer against the compiled serializers + ORJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        cases = [
+            ('products', ProductSerializer, Product.objects.order_by('id')[:rows]),
+            ('orders', OrderSerializer, Order.objects.prefetch_related(
+                Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+            ).order_by('id')[:rows]),
+            ('carts', CartSerilizer, Cart.objects.prefetch_related(
+                Prefetch('items', queryset=CartItem.objects.select_related('product')),
+            ).order_by('id')[:rows]),
+        ]
+
+        for name, serializer_class, queryset in cases:
+            # loaded once, only serialization and rendering are measured
+            instances = list(queryset)
+            if not instances:
+                self.stdout.write(f"{name}: no rows, run setup_fake_data first")
+                continue
+
+            def drf():
+                return JSONRenderer().render(serializer_class(instances, many=True).data)
+
+            def compiled():
+                to_dict = compile_serializer(serializer_class())
+                return ORJSONRenderer().render([to_dict(instance) for instance in instances])
+
+            if drf() != compiled():
+                raise CommandError(f"{name}: compiled output is not byte-identical to the DRF output")
+
+            before = self.rows_per_second(drf, len(instances), repeat)
+            after = self.rows_per_second(compiled, len(instances), repeat)
+            self.stdout.write(
+                f"{name}: {len(instances)} rows, byte-identical, "
+                f"drf {before:,.0f} rows/s -> compiled {after:,.0f} rows/s ({after / before:.1f}x)"
+            )
+
+    def rows_per_second(self, render, count, repeat):
+        best = min(self.timed(render) for _ in range(repeat))
+        return count / best
+
+    def timed(self, render):
+        started = time.perf_counter()
+        render()
+        return time.perf_counter() - started
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.signals.dispatch import outbox_stats, process_outbox_batch, purge_processed_outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers the queued store signals (order_created, ...) from the SignalOutbox table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=10, help='messages are marked dead after this many failures')
+        parser.add_argument('--sleep', type=float, default=1.0, help='seconds to wait when the queue is empty')
+        parser.add_argument('--stats-every', type=float, default=60.0, help='seconds between queue depth / lag reports')
+        parser.add_argument('--keep-days', type=float, default=7.0, help='delivered messages older than this are purged')
+        parser.add_argument('--once', action='store_true', help='drain the due messages and exit')
+
+    def handle(self, *args, **options):
+        delivered_total = failed_total = 0
+        last_stats = 0.0
+
+        while True:
+            close_old_connections()
+            started = time.monotonic()
+            delivered, failed = process_outbox_batch(options['batch_size'], options['max_attempts'])
+            delivered_total += delivered
+            failed_total += failed
+
+            if delivered or failed:
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f"delivered {delivered}, failed {failed} ({(delivered + failed) / elapsed:,.0f} msg/s)")
+
+            if time.monotonic() - last_stats >= options['stats_every'] or (options['once'] and not (delivered or failed)):
+                purged = purge_processed_outbox(timedelta(days=options['keep_days']))
+                stats = outbox_stats()
+                self.stdout.write(
+                    f"queue depth={stats['depth']} lag={stats['lag_seconds']:.1f}s dead={stats['dead']} "
+                    f"delivered={delivered_total} failed={failed_total} purged={purged}"
+                )
+                last_stats = time.monotonic()
+
+            if delivered + failed < options['batch_size']:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.idempotency import purge_expired_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired Idempotency-Key responses in bounded batches, e.g. from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='keys deleted per DELETE')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        deleted = purge_expired_idempotency_keys(options['batch_size'])
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f"deleted {deleted} expired idempotency keys in {elapsed:.1f}s ({deleted / elapsed:,.0f} rows/s)")
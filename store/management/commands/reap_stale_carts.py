@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from store.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = "Deletes carts idle for longer than settings.CART_TTL in bounded batches, e.g. from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=float, default=None, help='overrides settings.CART_TTL')
+        parser.add_argument('--batch-size', type=int, default=1000, help='carts deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='seconds to wait between batches')
+        parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='only count the stale carts')
+
+    def handle(self, *args, **options):
+        ttl = timedelta(days=options['ttl_days']) if options['ttl_days'] is not None else settings.CART_TTL
+        cutoff = timezone.now() - ttl
+        stale = Cart.objects.filter(last_activity_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"{stale.count()} carts idle since before {cutoff:%Y-%m-%d %H:%M}")
+            return
+
+        started = time.monotonic()
+        batches = carts_deleted = items_deleted = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            close_old_connections()
+            carts, items = self.delete_batch(stale, options['batch_size'])
+            if not carts:
+                break
+            batches += 1
+            carts_deleted += carts
+            items_deleted += items
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"\rdeleted {carts_deleted} carts, {items_deleted} items "
+                f"({(carts_deleted + items_deleted) / elapsed:,.0f} rows/s)", ending=''
+            )
+            self.stdout.flush()
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f"\rdeleted {carts_deleted} carts, {items_deleted} items in {batches} batches, "
+            f"{elapsed:.1f}s ({(carts_deleted + items_deleted) / elapsed:,.0f} rows/s)"
+        )
+
+    @transaction.atomic
+    def delete_batch(self, stale, batch_size):
+        # the oldest carts first, carts locked by an item writer or a checkout are left for the next run
+        ids = list(
+            stale.select_for_update(skip_locked=True)
+            .order_by('last_activity_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+        # plain DELETEs, Model.delete() would load every item and send a post_delete signal for each
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {CartItem._meta.db_table} WHERE cart_id = ANY(%s)', [ids])
+            items = cursor.rowcount
+            cursor.execute(f'DELETE FROM {Cart._meta.db_table} WHERE id = ANY(%s)', [ids])
+            carts = cursor.rowcount
+        return carts, items
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from store.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized products_count of every category"
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        products_count = Product.objects.filter(category=OuterRef('pk'))\
+            .order_by()\
+            .values('category')\
+            .annotate(count=Count('pk'))\
+            .values('count')
+
+        updated = Category.objects.update(
+            products_count=Coalesce(Subquery(products_count), Value(0)),
+        )
+        self.stdout.write(f"Rebuilt products count of {updated} categories.")
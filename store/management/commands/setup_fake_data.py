@@ -0,0 +1,404 @@
+# setup_test_data.py
+import csv
+import io
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import django
+from faker import Faker
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from store.cache import bump_catalog_version
+from store.models import Address, Cart, CartItem, Category, Comment, Order, OrderItem, Product, Discount, Customer
+from store.pricing import refresh_effective_prices
+
+from .rebuild_category_counters import Command as RebuildCategoryCountersCommand
+
+
+list_of_models = [CartItem, Cart, OrderItem, Order, Product.discounts.through, Comment, Product, Category, Discount, Address, Customer]
+
+NUM_CATEGORIES = 100
+NUM_DISCOUNTS = 10
+NUM_PRODUCTS = 1000
+NUM_CUSTOMERS = 100
+NUM_ORDERS = 30
+NUM_COMMENTS = 3000
+NUM_CARTS = 100
+
+DISCOUNTED_PRODUCTS_RATIO = 0.3
+
+FAKE_USERNAME_PREFIX = 'fake_'
+DATE_START = datetime(2019, 1, 1, tzinfo=timezone.utc)
+DATE_SPAN_SECONDS = int(timedelta(days=4 * 365).total_seconds())
+
+# every worker process builds these once and reuses them
+_text_pools = {}
+_id_pools = {}
+
+
+class TextPool:
+    """
+    a pre-generated pool of faker words and sentences,
+    sampling from it is much faster than calling faker for every row.
+    """
+    def __init__(self, seed, size=2000):
+        faker = Faker()
+        faker.seed_instance(seed)
+        self.words = [faker.word() for _ in range(size)]
+        self.sentences = [faker.sentence() for _ in range(size)]
+        self.first_names = [faker.first_name() for _ in range(size // 4)]
+        self.last_names = [faker.last_name() for _ in range(size // 4)]
+
+    def title(self, rng, nb_words=3):
+        return ' '.join(rng.choice(self.words).capitalize() for _ in range(nb_words))
+
+    def paragraph(self, rng, nb_sentences=3):
+        return ' '.join(rng.choice(self.sentences) for _ in range(nb_sentences))
+
+
+def get_text_pool(seed):
+    if seed not in _text_pools:
+        _text_pools[seed] = TextPool(seed)
+    return _text_pools[seed]
+
+
+def get_ids(model):
+    if model not in _id_pools:
+        _id_pools[model] = list(model.objects.order_by('pk').values_list('pk', flat=True))
+    return _id_pools[model]
+
+
+def random_datetime(rng):
+    return DATE_START + timedelta(seconds=rng.randrange(DATE_SPAN_SECONDS))
+
+
+def can_use_copy():
+    return connection.vendor == 'postgresql'
+
+
+@contextmanager
+def explicit_timestamps():
+    """ lets bulk_create keep the generated dates instead of auto_now / auto_now_add """
+    fields = [
+        Product._meta.get_field('datetime_created'),
+        Product._meta.get_field('datetime_modified'),
+        Comment._meta.get_field('datetime_created'),
+        Order._meta.get_field('datetime_created'),
+        Cart._meta.get_field('created_at'),
+    ]
+    previous = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, previous):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def copy_rows(model, fields, rows):
+    """ writes rows with postgres COPY, much faster than INSERT for big batches """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in row])
+    buffer.seek(0)
+
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+    sql = f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    with connection.cursor() as cursor:
+        if hasattr(cursor, 'copy_expert'):  # psycopg2
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def insert_rows(model, fields, rows, use_copy, batch_size):
+    rows = list(rows)
+    if use_copy:
+        copy_rows(model, fields, rows)
+        return
+    with explicit_timestamps():
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, row))) for row in rows],
+            batch_size=batch_size,
+        )
+
+
+def generate_products(rng, pool, count):
+    category_ids = get_ids(Category)
+    for _ in range(count):
+        title = pool.title(rng)
+        created = random_datetime(rng)
+        yield (
+            title,
+            '-'.join(title.split(' ')).lower(),
+            pool.paragraph(rng, rng.randint(1, 5))[:1000],
+            rng.randint(1, 9999) + rng.randint(0, 99) / 100,
+            rng.randint(1, 100),
+            rng.choice(category_ids),
+            created,
+            created + timedelta(hours=rng.randint(1, 500)),
+        )
+
+
+PRODUCT_FIELDS = ['title', 'slug', 'description', 'unit_price', 'inventory', 'category_id',
+                  'datetime_created', 'datetime_modified']
+
+
+def generate_comments(rng, pool, count):
+    product_ids = get_ids(Product)
+    user_ids = get_ids(get_user_model())
+    statuses = [Comment.COMMENT_STATUS_WAITING, Comment.COMMENT_STATUS_APPROVED, Comment.COMMENT_STATUS_NOT_APPROVED]
+    for _ in range(count):
+        yield (
+            rng.choice(user_ids),
+            rng.choice(product_ids),
+            pool.paragraph(rng, rng.randint(1, 3))[:1000],
+            random_datetime(rng),
+            rng.choice(statuses),
+        )
+
+
+COMMENT_FIELDS = ['user_id', 'product_id', 'body', 'datetime_created', 'status']
+
+
+def generate_orders(rng, pool, count):
+    customer_ids = get_ids(Customer)
+    product_ids = get_ids(Product)
+    statuses = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_UNPAID, Order.ORDER_STATUS_CANCELED]
+    for _ in range(count):
+        # (product_id, quantity, unit_price) lines of the order, the order totals are inserted with the order
+        lines = [
+            (product_id, rng.randint(1, 20), Decimal(rng.randint(1, 9999)) + Decimal(rng.randint(0, 99)) / 100)
+            for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 10)))
+        ]
+        yield (rng.choice(customer_ids), rng.choice(statuses), random_datetime(rng)), lines
+
+
+def create_orders(rows, use_copy, batch_size):
+    with explicit_timestamps():
+        orders = Order.objects.bulk_create([
+            Order(customer_id=customer_id, status=status, datetime_created=datetime_created,
+                  item_count=sum(quantity for _, quantity, _ in lines),
+                  total_price=sum(quantity * unit_price for _, quantity, unit_price in lines))
+            for (customer_id, status, datetime_created), lines in rows
+        ], batch_size=batch_size)
+
+    items = [
+        (order.pk, product_id, quantity, unit_price)
+        for order, (_, lines) in zip(orders, rows)
+        for product_id, quantity, unit_price in lines
+    ]
+    insert_rows(OrderItem, ['order_id', 'product_id', 'quantity', 'unit_price'], items, use_copy, batch_size)
+
+
+def generate_carts(rng, pool, count):
+    product_ids = get_ids(Product)
+    for _ in range(count):
+        created_at = random_datetime(rng)
+        cart_id = UUID(int=rng.getrandbits(128), version=4)
+        items = [
+            (cart_id, product_id, rng.randint(1, 20))
+            for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 10)))
+        ]
+        yield (cart_id, created_at, created_at, created_at), items
+
+
+def create_carts(rows, use_copy, batch_size):
+    insert_rows(Cart, ['id', 'created_at', 'updated_at', 'last_activity_at'], [cart for cart, _ in rows], use_copy, batch_size)
+    insert_rows(CartItem, ['cart_id', 'product_id', 'quantity'], [item for _, items in rows for item in items],
+                use_copy, batch_size)
+
+
+def generate_chunk(kind, count, seed, pool_seed):
+    """ generates the rows of one chunk, runs either inline or inside a worker process """
+    rng = random.Random(seed)
+    pool = get_text_pool(pool_seed)
+    if kind == 'products':
+        return list(generate_products(rng, pool, count))
+    elif kind == 'comments':
+        return list(generate_comments(rng, pool, count))
+    elif kind == 'orders':
+        return list(generate_orders(rng, pool, count))
+    elif kind == 'carts':
+        return list(generate_carts(rng, pool, count))
+
+
+@transaction.atomic
+def write_chunk(kind, rows, use_copy, batch_size):
+    """ writes one chunk, always from the main process and in chunk order, so the ids follow the seed """
+    if kind == 'products':
+        insert_rows(Product, PRODUCT_FIELDS, rows, use_copy, batch_size)
+    elif kind == 'comments':
+        insert_rows(Comment, COMMENT_FIELDS, rows, use_copy, batch_size)
+    elif kind == 'orders':
+        create_orders(rows, use_copy, batch_size)
+    elif kind == 'carts':
+        create_carts(rows, use_copy, batch_size)
+    return len(rows)
+
+
+def init_worker():
+    django.setup()
+    # connections inherited from the parent process must not be shared
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Generates fake data, e.g. `setup_fake_data --products 1000000 --workers 4 --seed 42`"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=NUM_CATEGORIES)
+        parser.add_argument('--discounts', type=int, default=NUM_DISCOUNTS)
+        parser.add_argument('--products', type=int, default=NUM_PRODUCTS)
+        parser.add_argument('--customers', type=int, default=NUM_CUSTOMERS)
+        parser.add_argument('--orders', type=int, default=NUM_ORDERS)
+        parser.add_argument('--comments', type=int, default=NUM_COMMENTS)
+        parser.add_argument('--carts', type=int, default=NUM_CARTS)
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per INSERT / COPY batch')
+        parser.add_argument('--workers', type=int, default=1, help='number of processes generating rows in parallel')
+        parser.add_argument('--seed', type=int, default=None, help='makes the generated dataset reproducible')
+        parser.add_argument('--no-copy', action='store_true', help='use bulk_create even on postgres')
+        parser.add_argument('--keep', action='store_true', help="don't delete the existing data first")
+
+    def handle(self, *args, **options):
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(seed)
+        self.batch_size = options['batch_size']
+        self.use_copy = can_use_copy() and not options['no_copy']
+        started = time.monotonic()
+
+        if not options['keep']:
+            self.stdout.write("Deleting old data...")
+            self.delete_old_data()
+
+        self.stdout.write(f"Creating new data with seed {seed} ({'COPY' if self.use_copy else 'bulk_create'})...")
+        self.pool_seed = seed
+        pool = get_text_pool(seed)
+
+        self.report('categories', options['categories'], lambda: Category.objects.bulk_create([
+            Category(title=pool.title(self.rng, 2), description=pool.paragraph(self.rng, 1)[:500])
+            for _ in range(options['categories'])
+        ], batch_size=self.batch_size))
+
+        self.report('discounts', options['discounts'], lambda: Discount.objects.bulk_create([
+            Discount(title=pool.title(self.rng, 2), discount=self.rng.randint(1, 80) / 100,
+                     description=pool.paragraph(self.rng, 1)[:255])
+            for _ in range(options['discounts'])
+        ], batch_size=self.batch_size))
+
+        self.report('customers', options['customers'], lambda: self.create_customers(pool, options['customers']))
+
+        self.run_parallel('products', options['products'], options['workers'])
+        _id_pools.clear()
+        self.report('product discounts', options['products'], self.create_product_discounts)
+        # bulk inserts skip the signals that keep these up to date.
+        # the prices go first, the cart totals are summed from them
+        self.report('effective prices', options['products'], lambda: refresh_effective_prices(Product.objects.all()))
+        self.run_parallel('orders', options['orders'], options['workers'])
+        self.run_parallel('comments', options['comments'], options['workers'])
+        self.run_parallel('carts', options['carts'], options['workers'])
+
+        RebuildCategoryCountersCommand(stdout=self.stdout, stderr=self.stderr).handle()
+        self.report('comment counters', options['products'], lambda: Product.refresh_comments_count(Product.objects.all()))
+        self.report('cart totals', options['carts'], lambda: Cart.refresh_totals(Cart.objects.all()))
+        bump_catalog_version()
+
+        self.stdout.write(f"DONE in {time.monotonic() - started:.1f}s")
+
+    def delete_old_data(self):
+        if connection.vendor == 'postgresql':
+            tables = ', '.join(connection.ops.quote_name(m._meta.db_table) for m in list_of_models)
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {tables} CASCADE')
+        else:
+            for m in list_of_models:
+                m.objects.all().delete()
+        get_user_model().objects.filter(username__startswith=FAKE_USERNAME_PREFIX).delete()
+
+    @transaction.atomic
+    def create_customers(self, pool, count):
+        User = get_user_model()
+        token = self.rng.getrandbits(32)
+        users = User.objects.bulk_create([
+            User(
+                username=f'{FAKE_USERNAME_PREFIX}{token:x}_{i}',
+                email=f'{FAKE_USERNAME_PREFIX}{token:x}_{i}@example.com',
+                first_name=self.rng.choice(pool.first_names),
+                last_name=self.rng.choice(pool.last_names),
+                password='!',
+            ) for i in range(count)
+        ], batch_size=self.batch_size)
+
+        customers = Customer.objects.bulk_create([
+            Customer(
+                user_id=user.pk,
+                phone_number=self.rng.randint(900000000, 999999999) if self.rng.random() > 0.3 else None,
+                birth_date=(DATE_START - timedelta(days=self.rng.randint(0, 25 * 365))).date() if self.rng.random() > 0.3 else None,
+            ) for user in users
+        ], batch_size=self.batch_size)
+
+        Address.objects.bulk_create([
+            Address(customer_id=customer.pk, province=self.rng.choice(pool.words), city=self.rng.choice(pool.words),
+                    street=f'street {self.rng.randint(1, 50)}')
+            for customer in customers
+        ], batch_size=self.batch_size)
+
+    @transaction.atomic
+    def create_product_discounts(self):
+        discount_ids = get_ids(Discount)
+        if not discount_ids:
+            return
+        links = [
+            (product_id, discount_id)
+            for product_id in get_ids(Product) if self.rng.random() < DISCOUNTED_PRODUCTS_RATIO
+            for discount_id in self.rng.sample(discount_ids, min(len(discount_ids), self.rng.randint(1, 2)))
+        ]
+        insert_rows(Product.discounts.through, ['product_id', 'discount_id'], links, self.use_copy, self.batch_size)
+
+    def report(self, label, count, create):
+        started = time.monotonic()
+        self.stdout.write(f"Adding {count} {label}...", ending='')
+        self.stdout.flush()
+        create()
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f" DONE ({count / elapsed:,.0f} rows/s)")
+
+    def run_parallel(self, kind, total, workers):
+        chunk_size = self.batch_size * 4
+        chunks = [
+            (kind, min(chunk_size, total - start), self.rng.getrandbits(32), self.pool_seed)
+            for start in range(0, total, chunk_size)
+        ]
+        self.started = time.monotonic()
+        self.done = 0
+
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                self.progress(kind, total, write_chunk(kind, generate_chunk(*chunk), self.use_copy, self.batch_size))
+        else:
+            # children open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                # the workers generate ahead, map() hands the chunks back in submission order
+                for rows in executor.map(generate_chunk, *zip(*chunks)):
+                    self.progress(kind, total, write_chunk(kind, rows, self.use_copy, self.batch_size))
+
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(f"\rAdding {total} {kind}... DONE ({total / elapsed:,.0f} rows/s)")
+
+    def progress(self, kind, total, count):
+        self.done += count
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(f"\rAdding {total} {kind}... {self.done}/{total} ({self.done / elapsed:,.0f} rows/s)", ending='')
+        self.stdout.flush()
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_products_count(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    Product = apps.get_model('store', 'Product')
+
+    products_count = Product.objects.filter(category=OuterRef('pk'))\
+        .order_by()\
+        .values('category')\
+        .annotate(count=Count('pk'))\
+        .values('count')
+    Category.objects.update(products_count=Coalesce(Subquery(products_count), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_alter_customer_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='products count'),
+        ),
+        migrations.RunPython(populate_products_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('store', 'CartItem')
+
+    duplicates = CartItem.objects.values('cart_id', 'product_id')\
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))\
+        .filter(rows__gt=1)
+    for duplicate in duplicates:
+        items = CartItem.objects.filter(cart_id=duplicate['cart_id'], product_id=duplicate['product_id'])
+        items.exclude(id=duplicate['keep_id']).delete()
+        items.update(quantity=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignalOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signal', models.CharField(max_length=100, verbose_name='signal')),
+                ('sender', models.CharField(max_length=255, verbose_name='sender')),
+                ('payload', models.JSONField(default=dict, verbose_name='payload')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='available at')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='processed at')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('dead', models.BooleanField(default=False, verbose_name='dead')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+            ],
+            options={
+                'verbose_name': 'signal outbox message',
+                'verbose_name_plural': 'signal outbox messages',
+                'indexes': [models.Index(condition=models.Q(('dead', False), ('processed_at__isnull', True)), fields=['available_at', 'id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:09
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # nothing recorded when the existing carts last changed, created_at is the best estimate.
+    # the AddField default alone would make every one of them look fresh to the reaper
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_signaloutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='updated at'),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:13
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def populate_effective_prices(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    price_field = DecimalField(max_digits=8, decimal_places=2)
+
+    discounts = Product.discounts.through.objects.filter(product_id=OuterRef('pk'))\
+        .order_by()\
+        .values('product_id')\
+        .annotate(best=Max('discount__discount'))\
+        .values('best')
+    best_discount = Coalesce(Subquery(discounts, output_field=FloatField()), Value(0.0))
+    multiplier = Value(Decimal(1)) - Cast(best_discount, DecimalField(max_digits=5, decimal_places=4))
+    effective_price = Round(ExpressionWrapper(F('unit_price') * multiplier, output_field=price_field), 2,
+                            output_field=price_field)
+    Product.objects.update(best_discount=best_discount, effective_price=effective_price)
+    Product.objects.update(final_price=Round(
+        ExpressionWrapper(F('effective_price') * Value(Decimal('1.09')), output_field=price_field), 2,
+        output_field=price_field,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='best_discount',
+            field=models.FloatField(db_default=0, default=0, editable=False, verbose_name='best discount'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='effective price'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, editable=False, max_digits=8, verbose_name='final price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['final_price', 'id'], name='product_final_price_id_idx'),
+        ),
+        migrations.RunPython(populate_effective_prices, migrations.RunPython.noop),
+    ]
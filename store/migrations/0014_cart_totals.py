@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:16
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+
+    items = CartItem.objects.filter(cart_id=OuterRef('pk')).order_by().values('cart_id')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), Value(0)),
+        total_price=Coalesce(
+            Subquery(items.annotate(total=Sum(F('quantity') * F('product__effective_price'))).values('total')),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_product_effective_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False, verbose_name='item count'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total price'),
+        ),
+        migrations.RunPython(populate_cart_totals, migrations.RunPython.noop),
+    ]
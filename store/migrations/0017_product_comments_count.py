@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:26
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_comments_count(apps, schema_editor):
+    Comment = apps.get_model('store', 'Comment')
+    Product = apps.get_model('store', 'Product')
+
+    approved_count = Comment.objects.filter(product_id=OuterRef('pk'), status='a')\
+        .order_by()\
+        .values('product_id')\
+        .annotate(count=Count('pk'))\
+        .values('count')
+    Product.objects.update(comments_count=Coalesce(Subquery(approved_count), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comments_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False, verbose_name='comments count'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'status', 'datetime_created', 'id'], name='comment_product_status_idx'),
+        ),
+        migrations.RunPython(populate_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:32
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_order_totals(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    Order.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), Value(0)),
+        total_price=Coalesce(
+            Subquery(items.annotate(total=Sum(F('quantity') * F('unit_price'))).values('total')),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False, verbose_name='item count'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total price'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_price', 'id'], name='order_total_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'total_price', 'id'], name='order_customer_total_price_idx'),
+        ),
+        migrations.RunPython(populate_order_totals, migrations.RunPython.noop),
+    ]
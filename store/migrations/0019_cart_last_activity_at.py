@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:41
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_activity_at(apps, schema_editor):
+    # updated_at is also bumped by price changes, but it is the closest thing recorded so far
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(last_activity_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_order_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cart',
+            name='cart_updated_at_idx',
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='last activity at'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['last_activity_at'], name='cart_last_activity_at_idx'),
+        ),
+        migrations.RunPython(backfill_last_activity_at, migrations.RunPython.noop),
+    ]
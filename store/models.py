@@ -1,7 +1,14 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connections, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 from uuid import uuid4
 from django.utils.text import slugify
 
@@ -32,17 +39,36 @@ class Category(models.Model):
     title = models.CharField(max_length=255, verbose_name='title')
     description = models.CharField(max_length=500, blank=True, verbose_name='description')
     top_product = models.ForeignKey('Product', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', verbose_name='top product')
+    # denormalized counter kept in sync by store.signals.handlers
+    products_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('products count'))
 
     def __str__(self):
         return self.title
 
 
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        # search_vector is only read in SQL by store.filters.ProductSearchFilter, never by python
+        return super().get_queryset().defer('search_vector')
+
+
 class Product(models.Model):
     """ THIS IS THE PRODUCT MODEL  """
 
     class Meta:
         verbose_name = _('product')
         verbose_name_plural = _('products')
+        # composite indexes that back keyset pagination on every ordering field
+        indexes = [
+            models.Index(fields=['unit_price', 'id'], name='product_unit_price_id_idx'),
+            models.Index(fields=['inventory', 'id'], name='product_inventory_id_idx'),
+            models.Index(fields=['datetime_created', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['final_price', 'id'], name='product_final_price_id_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='product_title_trgm_idx'),
+        ]
+
+    objects = ProductManager()
 
     title = models.CharField(max_length=250, verbose_name='title')
     unit_price = models.DecimalField(max_digits=6, decimal_places=2, verbose_name=_('unit price'))
@@ -57,9 +83,36 @@ class Product(models.Model):
     datetime_created = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True, blank=True)
 
+    # effective prices computed by store.pricing and kept in sync by store.signals.handlers
+    best_discount = models.FloatField(default=0, db_default=0, editable=False, verbose_name=_('best discount'))
+    effective_price = models.DecimalField(max_digits=8, decimal_places=2, default=0, db_default=0, editable=False,
+                                          verbose_name=_('effective price'))
+    final_price = models.DecimalField(max_digits=8, decimal_places=2, default=0, db_default=0, editable=False,
+                                      verbose_name=_('final price'))
+    # approved comments only, kept in sync by store.signals.handlers
+    comments_count = models.PositiveIntegerField(default=0, db_default=0, editable=False,
+                                                 verbose_name=_('comments count'))
+
+    # stored tsvector used by store.filters.ProductSearchFilter
+    search_vector = models.GeneratedField(
+        expression=SearchVector('title', weight='A', config='english')
+                   + SearchVector('description', weight='B', config='english'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def refresh_comments_count(cls, products):
+        """ recomputes comments_count of the given products in one UPDATE, for writes that skip the signals """
+        approved_count = Comment.objects.filter(product_id=OuterRef('pk'), status=Comment.COMMENT_STATUS_APPROVED)\
+            .order_by()\
+            .values('product_id')\
+            .annotate(count=Count('pk'))\
+            .values('count')
+        return products.update(comments_count=Coalesce(Subquery(approved_count), Value(0)))
     
 
 class Comment(models.Model):
@@ -67,6 +120,11 @@ class Comment(models.Model):
     class Meta:
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
+        indexes = [
+            models.Index(fields=['product', 'datetime_created', 'id'], name='comment_product_created_id_idx'),
+            # the public listing: approved comments of a product, newest first
+            models.Index(fields=['product', 'status', 'datetime_created', 'id'], name='comment_product_status_idx'),
+        ]
 
     COMMENT_STATUS_WAITING = 'w'
     COMMENT_STATUS_APPROVED = 'a'
@@ -104,6 +162,9 @@ class Customer(models.Model):
     phone_number = models.IntegerField(null=True,blank=True, verbose_name=_("phone_number"), )
     birth_date = models.DateField(null=True,blank=True,verbose_name=_('birth date'))
 
+    # joined by core.admin_tools.ListSelectRelatedAdminMixin wherever a customer is listed
+    str_select_related = ['user']
+
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}'
 
@@ -127,6 +188,12 @@ class Order(models.Model):
     class Meta:
         verbose_name = _('order')
         verbose_name_plural = _('orders')
+        indexes = [
+            models.Index(fields=['datetime_created', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['customer', 'datetime_created', 'id'], name='order_customer_created_id_idx'),
+            models.Index(fields=['total_price', 'id'], name='order_total_price_id_idx'),
+            models.Index(fields=['customer', 'total_price', 'id'], name='order_customer_total_price_idx'),
+        ]
 
     ORDER_STATUS_PAID = 'P'
     ORDER_STATUS_UNPAID = 'U'
@@ -143,9 +210,25 @@ class Order(models.Model):
     status = models.CharField(max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID, verbose_name=_('status'))
     datetime_created = models.DateTimeField(auto_now_add=True, verbose_name=_('created time'))
 
+    # filled at checkout, kept in sync with later item edits by store.signals.handlers
+    item_count = models.PositiveIntegerField(default=0, db_default=0, editable=False, verbose_name=_('item count'))
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_default=0, editable=False,
+                                      verbose_name=_('total price'))
+
     def __str__(self):
         return f'Order id={self.id}'
 
+    @classmethod
+    def refresh_totals(cls, orders):
+        """ recomputes item_count / total_price of the given orders from their items in one UPDATE """
+        items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+        item_count = items.annotate(count=Sum('quantity')).values('count')
+        total_price = items.annotate(total=Sum(F('quantity') * F('unit_price'))).values('total')
+        return orders.update(
+            item_count=Coalesce(Subquery(item_count), Value(0)),
+            total_price=Coalesce(Subquery(total_price), Value(Decimal(0)), output_field=cls._meta.get_field('total_price')),
+        )
+
 
 
 
@@ -173,9 +256,90 @@ class Cart(models.Model):
     class Meta:
         verbose_name = _('cart')
         verbose_name_plural = _('carts')
+        # drives the idle scan of the reap_stale_carts command
+        indexes = [
+            models.Index(fields=['last_activity_at'], name='cart_last_activity_at_idx'),
+        ]
 
     id = models.UUIDField(primary_key=True, default=uuid4,)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+    # bumped whenever the cart content or its prices change, used for the cart ETag / Last-Modified
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name=_('updated at'))
+    # bumped only by the cart and item writers (see lock()), carts idle since CART_TTL are reaped
+    last_activity_at = models.DateTimeField(default=timezone.now, verbose_name=_('last activity at'))
+    # denormalized totals, recomputed by refresh_totals() whenever the items or their prices change
+    item_count = models.PositiveIntegerField(default=0, db_default=0, editable=False, verbose_name=_('item count'))
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_default=0, editable=False,
+                                      verbose_name=_('total price'))
+
+    @classmethod
+    def lock(cls, cart_id):
+        """
+        locks the cart row and marks the cart active, call it inside a transaction before changing
+        the cart items. returns None when there is no such cart.
+        """
+        # the UPDATE takes the same row lock as SELECT ... FOR UPDATE
+        updated = cls.objects.filter(pk=cart_id).update(last_activity_at=timezone.now())
+        return cart_id if updated else None
+
+    @classmethod
+    def refresh_totals(cls, carts):
+        """
+        recomputes item_count / total_price of the given carts from their items in one UPDATE
+        and bumps updated_at. the item writers lock the cart row first, so concurrent
+        changes to the same cart are serialized and the totals never drift.
+        """
+        items = CartItem.objects.filter(cart_id=OuterRef('pk')).order_by().values('cart_id')
+        item_count = items.annotate(count=Sum('quantity')).values('count')
+        total_price = items.annotate(total=Sum(F('quantity') * F('product__effective_price'))).values('total')
+        return carts.update(
+            item_count=Coalesce(Subquery(item_count), Value(0)),
+            total_price=Coalesce(Subquery(total_price), Value(Decimal(0)), output_field=cls._meta.get_field('total_price')),
+            updated_at=timezone.now(),
+        )
+
+
+class CartItemManager(models.Manager):
+    def upsert(self, cart_id, quantities, increment=True):
+        """
+        adds {product_id: quantity} to the cart in one INSERT ... ON CONFLICT DO UPDATE statement.
+        existing rows get the quantity added (or replaced when increment is False),
+        a sum past the largest value of the quantity column is capped to it.
+        returns the affected CartItem rows.
+        """
+        if not quantities:
+            return []
+
+        connection = connections[self.db]
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        cart_column = qn(opts.get_field('cart').column)
+        product_column = qn(opts.get_field('product').column)
+        quantity_column = qn(opts.get_field('quantity').column)
+        db_cart_id = opts.get_field('cart').get_db_prep_value(cart_id, connection)
+        max_quantity = connection.ops.integer_field_range(opts.get_field('quantity').get_internal_type())[1]
+
+        # summed as integer, a smallint sum would overflow before LEAST() caps it
+        new_quantity = f'LEAST(CAST({table}.{quantity_column} AS integer) + EXCLUDED.{quantity_column}, {max_quantity})' \
+            if increment else f'EXCLUDED.{quantity_column}'
+        sql = (
+            f'INSERT INTO {table} ({cart_column}, {product_column}, {quantity_column}) '
+            f'VALUES {", ".join(["(%s, %s, %s)"] * len(quantities))} '
+            f'ON CONFLICT ({cart_column}, {product_column}) DO UPDATE SET {quantity_column} = {new_quantity} '
+            f'RETURNING {qn(opts.pk.column)}, {product_column}, {quantity_column}'
+        )
+        params = [value for product_id, quantity in quantities.items() for value in (db_cart_id, product_id, quantity)]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        Cart.refresh_totals(Cart.objects.filter(pk=cart_id))
+
+        return [
+            self.model(id=pk, cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for pk, product_id, quantity in rows
+        ]
 
 
 class CartItem(models.Model):
@@ -184,9 +348,67 @@ class CartItem(models.Model):
     class Meta:
         verbose_name = _('cart items')
         verbose_name_plural = _('carts items')
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    objects = CartItemManager()
 
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_items')
     quantity = models.PositiveSmallIntegerField(_('quantity'))
     
 
+
+
+class SignalOutbox(models.Model):
+    """ this is the outbox of signals waiting to be delivered by the process_signal_outbox worker """
+
+    class Meta:
+        verbose_name = _('signal outbox message')
+        verbose_name_plural = _('signal outbox messages')
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_pending_idx',
+                         condition=models.Q(processed_at__isnull=True, dead=False)),
+        ]
+
+    signal = models.CharField(max_length=100, verbose_name=_('signal'))
+    sender = models.CharField(max_length=255, verbose_name=_('sender'))
+    payload = models.JSONField(default=dict, verbose_name=_('payload'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+    available_at = models.DateTimeField(default=timezone.now, verbose_name=_('available at'))
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('processed at'))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_('attempts'))
+    dead = models.BooleanField(default=False, verbose_name=_('dead'))
+    last_error = models.TextField(blank=True, verbose_name=_('last error'))
+
+    def __str__(self):
+        return f'{self.signal} id={self.id}'
+
+
+class IdempotencyKey(models.Model):
+    """ this is the stored first response of a request sent with an Idempotency-Key header """
+
+    class Meta:
+        verbose_name = _('idempotency key')
+        verbose_name_plural = _('idempotency keys')
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_scope_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_at_idx'),
+        ]
+
+    # who the key belongs to, e.g. `orders:<user id>` or `cart-items:<cart id>`
+    scope = models.CharField(max_length=100, verbose_name=_('scope'))
+    key = models.CharField(max_length=255, verbose_name=_('key'))
+    # sha256 of the request, a reused key with another request is rejected
+    fingerprint = models.CharField(max_length=64, verbose_name=_('fingerprint'))
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name=_('status code'))
+    # response.data as compact JSON text, jsonb would reorder the keys of the replayed body
+    response_body = models.TextField(blank=True, verbose_name=_('response body'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+    expires_at = models.DateTimeField(verbose_name=_('expires at'))
+
+    def __str__(self):
+        return f'{self.scope} {self.key}'
@@ -1,4 +1,149 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
 
 class DefaultPagination(PageNumberPagination):
     page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """
+    keyset (seek) pagination: every page is `WHERE (field, id) > (last_field, last_id) LIMIT n`,
+    so the cost of a page does not depend on how deep it is and no COUNT(*) is needed.
+    the ordering comes from the `ordering` query param (one of view.ordering_fields)
+    and `id` is always added as the unique tiebreaker.
+    the cursor carries the field it was built for, a cursor replayed with another ordering is a 404.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = '-datetime_created'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get(self.ordering_query_param, '').split(',')[0].strip()
+        if ordering.lstrip('-') in (getattr(view, 'ordering_fields', None) or []):
+            return ordering.lstrip('-'), ordering.startswith('-')
+        return self.default_ordering.lstrip('-'), self.default_ordering.startswith('-')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            field, value, pk, reverse = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            if field != self.field:
+                raise ValueError('cursor ordering mismatch')
+            if value is not None:
+                value = model._meta.get_field(self.field).to_python(value)
+            pk = model._meta.get_field(self.tiebreaker).to_python(pk)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, bool(reverse)
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field)
+        value = None if value is None else str(value.isoformat() if hasattr(value, 'isoformat') else value)
+        cursor = json.dumps([self.field, value, getattr(obj, self.tiebreaker), int(reverse)], separators=(',', ':'))
+        encoded = urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request, view)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor[2])
+
+        # walking backwards is the same query with the direction flipped
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}{self.tiebreaker}')
+
+        if cursor:
+            value, pk, _ = cursor
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'{self.tiebreaker}__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = bool(cursor) if not reverse else has_more
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    """
+    keyset pagination is used only when the client opts in with `?pagination=cursor`
+    (or sends a cursor), otherwise fallback_pagination_class is used.
+    a fallback of None means the list stays unpaginated.
+    """
+    mode_query_param = 'pagination'
+    fallback_pagination_class = None
+
+    def use_keyset(self, request):
+        return request.query_params.get(self.mode_query_param) == 'cursor' \
+            or self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        if self.use_keyset(request):
+            return super().paginate_queryset(queryset, request, view)
+        if self.fallback_pagination_class is None:
+            return None
+        self.fallback = self.fallback_pagination_class()
+        return self.fallback.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ProductPagination(OptionalKeysetPagination):
+    fallback_pagination_class = DefaultPagination
+
@@ -10,6 +10,14 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         return bool(request.user and request.user.is_staff)
 
 
+class IsOwnerOrAdmin(permissions.BasePermission):
+    """ object level: writes are allowed to staff and to the user the object belongs to """
+    def has_object_permission(self, request, view, obj):
+        if request.method in SAFE_METHODS:
+            return True
+        return bool(request.user.is_staff or obj.user_id == request.user.id)
+
+
 class SendPrivateEmailToCustomerPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.has_perm('store.send_private_email'))
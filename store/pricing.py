@@ -0,0 +1,55 @@
+"""
+effective price engine.
+
+the best applicable discount, the discounted price and the price after tax are computed in SQL.
+refresh_effective_prices() stores the result in the Product.best_discount / effective_price /
+final_price columns, which is what the API filters, orders and serializes by, and what
+Cart.total_price is summed from.
+store.signals.handlers refreshes the stored prices whenever a price or a discount changes.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Now, Round
+
+from .models import Cart, Product
+
+
+TAX_RATE = Decimal('1.09')
+
+PRICE_FIELD = DecimalField(max_digits=8, decimal_places=2)
+
+
+def best_discount():
+    discounts = Product.discounts.through.objects\
+        .filter(product_id=OuterRef('pk'))\
+        .order_by()\
+        .values('product_id')\
+        .annotate(best=Max('discount__discount'))\
+        .values('best')
+    return Coalesce(Subquery(discounts, output_field=FloatField()), Value(0.0))
+
+
+def effective_price(discount):
+    multiplier = Value(Decimal(1)) - Cast(discount, DecimalField(max_digits=5, decimal_places=4))
+    return Round(ExpressionWrapper(F('unit_price') * multiplier, output_field=PRICE_FIELD), 2, output_field=PRICE_FIELD)
+
+
+def final_price(price):
+    return Round(ExpressionWrapper(price * Value(TAX_RATE), output_field=PRICE_FIELD), 2, output_field=PRICE_FIELD)
+
+
+def refresh_effective_prices(queryset):
+    """
+    recomputes the stored prices of the given products, the discount subquery runs once per row.
+    the totals of the carts holding these products are recomputed as well.
+    datetime_modified is bumped, it is the Last-Modified of the product.
+    """
+    queryset.update(best_discount=best_discount())
+    updated = queryset.update(
+        effective_price=effective_price(F('best_discount')),
+        final_price=final_price(effective_price(F('best_discount'))),
+        datetime_modified=Now(),
+    )
+    Cart.refresh_totals(Cart.objects.filter(items__product__in=queryset.values('pk')))
+    return updated
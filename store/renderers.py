@@ -0,0 +1,33 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stock renderer is used without it
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    renders with orjson and produces the same bytes as the compact, unicode JSONRenderer.
+    anything orjson can't encode natively (Decimal, lazy strings, datetimes, ...) goes through
+    DRF's JSONEncoder, and indented output is left to JSONRenderer.
+    """
+    encoder = JSONEncoder()
+
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # same escaping JSONRenderer does, these two are valid JSON but not valid javascript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -1,23 +1,28 @@
-from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.db.models.functions import Now
 from django.utils.text import slugify
 
 from rest_framework import serializers
 
+from .cache import bump_inventory_versions
 from .models import Product, Category, Comment, Cart, CartItem, Customer, Order, OrderItem
 
 
 class ProductSerializer(serializers.ModelSerializer):
     name = serializers.CharField(max_length=250, source='title')
     price = serializers.DecimalField(max_digits=6, decimal_places=2, source='unit_price')
-    unit_price_after_tax = serializers.SerializerMethodField()
+    discount = serializers.FloatField(source='best_discount', read_only=True)
+    # best discount and tax applied, computed in SQL by store.pricing
+    unit_price_after_tax = serializers.DecimalField(max_digits=8, decimal_places=2, source='final_price', read_only=True)
     class Meta:
         model = Product
-        fields = ['id', 'name','slug', 'price','unit_price_after_tax', 'category', 'inventory', 'description']
+        fields = ['id', 'name','slug', 'price', 'discount', 'unit_price_after_tax', 'category', 'inventory', 'description']
         read_only_fields = ['slug',]
 
-    def get_unit_price_after_tax(self, product):
-        return round(product.unit_price * Decimal(1.09), 2)
-
     def validate(self, data):
         if len(data['title']) < 5:
             raise serializers.ValidationError('mroduct title length should be more that 5 vharacters')
@@ -31,7 +36,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
 class CategorySerializer(serializers.ModelSerializer):
     # num_of_products = serializers.SerializerMethodField()
-    num_of_products = serializers.IntegerField(source='products.count', read_only=True)
+    num_of_products = serializers.IntegerField(source='products_count', read_only=True)
 
     class Meta:
         model = Category
@@ -54,10 +59,35 @@ class CommentSerializer(serializers.ModelSerializer):
         return Comment.objects.create(product_id=product_id,user_id=user_id, **validated_data)
 
 
+class CommentModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=Comment.COMMENT_STATUS)
+
+    def save(self, **kwargs):
+        """ sets the status of all the comments with one UPDATE and returns the affected counts """
+        ids = set(self.validated_data['ids'])
+        new_status = self.validated_data['status']
+        with transaction.atomic():
+            comments = Comment.objects.filter(pk__in=ids)
+            # the rows stay locked until the counters below are recomputed
+            found = list(comments.select_for_update().values_list('product_id', 'status'))
+            product_ids = {product_id for product_id, comment_status in found if comment_status != new_status}
+            updated = comments.exclude(status=new_status).update(status=new_status)
+            # queryset.update() does not send post_save, so the comment counters are recomputed here
+            Product.refresh_comments_count(Product.objects.filter(pk__in=product_ids))
+        return {
+            'updated': updated,
+            'unchanged': len(found) - updated,
+            'not_found': len(ids) - len(found),
+        }
+
+
 class CartProductSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(max_length=250, source='title')
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'unit_price']
+        fields = ['id', 'name', 'unit_price', 'effective_price']
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -68,7 +98,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id','product','quantity','item_total']
 
     def get_item_total(self, cart_item):
-        return cart_item.quantity * cart_item.product.unit_price
+        return cart_item.quantity * cart_item.product.effective_price
 
 
 class AddCartItemSerializer(serializers.ModelSerializer):
@@ -78,22 +108,58 @@ class AddCartItemSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         cart_id = self.context['cart_pk']
-        
+
         product = validated_data.get('product')
         quantity = validated_data.get('quantity')
 
-        try :
-            cart_item = CartItem.objects.get(cart_id=cart_id, product=product)
-            cart_item.quantity += quantity
-            cart_item.save()
-        except CartItem.DoesNotExist:
-            cart_item = CartItem.objects.create(cart_id=cart_id, **validated_data)
-
+        cart_item, = CartItem.objects.upsert(cart_id, {product.pk: quantity})
 
         self.instance = cart_item
         return cart_item
 
 
+# the largest CartItem.quantity (a PositiveSmallIntegerField)
+MAX_CART_ITEM_QUANTITY = 32767
+
+
+class CartItemBatchEntrySerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_CART_ITEM_QUANTITY)
+
+
+class BatchCartItemSerializer(serializers.Serializer):
+    BATCH_MODE_ADD = 'add'
+    BATCH_MODE_SET = 'set'
+
+    items = CartItemBatchEntrySerializer(many=True, allow_empty=False, max_length=500)
+    mode = serializers.ChoiceField(choices=[BATCH_MODE_ADD, BATCH_MODE_SET], default=BATCH_MODE_ADD)
+
+    def validate_items(self, items):
+        quantities = {}
+        for item in items:
+            quantities[item['product']] = quantities.get(item['product'], 0) + item['quantity']
+
+        too_many = sorted(pk for pk, quantity in quantities.items() if quantity > MAX_CART_ITEM_QUANTITY)
+        if too_many:
+            raise serializers.ValidationError(
+                f'The quantity of products {too_many} is more than {MAX_CART_ITEM_QUANTITY}.')
+
+        # one query for all products instead of one PrimaryKeyRelatedField lookup per item
+        existing = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+        missing = sorted(set(quantities) - existing)
+        if missing:
+            raise serializers.ValidationError(f'There is no product with id {missing}.')
+        return quantities
+
+    def save(self, **kwargs):
+        cart_id = self.context['cart_pk']
+        increment = self.validated_data['mode'] == self.BATCH_MODE_ADD
+        try:
+            with transaction.atomic():
+                return CartItem.objects.upsert(cart_id, self.validated_data['items'], increment=increment)
+        except IntegrityError:
+            raise serializers.ValidationError({'cart': 'There is no cart with this cart id!'})
+
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -103,15 +169,17 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
 
 class CartSerilizer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['id','items','total_price']
+        fields = ['id','items','item_count','total_price']
         read_only_fields = ['id',]
 
-    def get_total_price(self, cart):
-        return sum([item.quantity * item.product.unit_price for item in cart.items.all()])
+
+class CartSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cart
+        fields = ['id', 'item_count', 'total_price', 'updated_at']
 
 
 
@@ -143,47 +211,75 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['customer','items', 'status', 'datetime_created'] 
+        fields = ['customer','items', 'item_count', 'total_price', 'status', 'datetime_created'] 
         read_only_fields = ['customer', 'status', 'datetime_created']
 
 
 class OrderCreateSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
 
-    def validate_cart_id(self, cart_id):
-        cart = Cart.objects.filter(id=cart_id)
-        if not cart.exists():
-            raise serializers.ValidationError('There is no cart with this cart id!')
-
-        if cart.count() == 0 :
-            raise serializers.ValidationError('Your cart is empty. Please add some products to it first!')
-
-        return cart_id
-
     def save(self, **kwargs):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
             user_id = self.context['user_id']
-            customer = Customer.objects.get(user_id=user_id)
-
-            order = Order()
-            order.customer = customer
-            order.save()
-
-            cart_items = CartItem.objects.select_related('product').filter(cart_id=cart_id)
 
+            # the cart row first, item writers lock it too before touching the items
+            if Cart.lock(cart_id) is None:
+                raise serializers.ValidationError({'cart_id': 'There is no cart with this cart id!'})
+
+            # locks the cart items and their products (in product id order, so concurrent
+            # checkouts of the same hot products queue up instead of deadlocking) in one query
+            cart_items = list(
+                CartItem.objects
+                .select_for_update(of=('self', 'product'))
+                .filter(cart_id=cart_id)
+                .select_related('product')
+                .order_by('product_id')
+            )
+
+            if not cart_items:
+                raise serializers.ValidationError({'cart_id': 'Your cart is empty. Please add some products to it first!'})
+
+            out_of_stock = [item.product_id for item in cart_items if item.product.inventory < item.quantity]
+            if out_of_stock:
+                raise serializers.ValidationError({'cart_id': f'There is not enough inventory for products {out_of_stock}.'})
+
+            # one set-based UPDATE for every product, the inventory guard makes it safe even without the lock
+            updated = Product.objects.filter(
+                reduce(or_, [Q(pk=item.product_id, inventory__gte=item.quantity) for item in cart_items])
+            ).update(
+                inventory=Case(
+                    *[When(pk=item.product_id, then=F('inventory') - item.quantity) for item in cart_items],
+                    output_field=IntegerField(),
+                ),
+                datetime_modified=Now(),
+            )
+            if updated != len(cart_items):
+                raise serializers.ValidationError({'cart_id': 'There is not enough inventory for some products.'})
+
+            customer_id = self.context.get('customer_id') or Customer.objects.values_list('id', flat=True).get(user_id=user_id)
             order_items = [
                 OrderItem(
-                    order=order,
-                    product=cart_item.product,
-                    unit_price=cart_item.product.unit_price,
+                    product_id=cart_item.product_id,
+                    unit_price=cart_item.product.effective_price,
                     quantity=cart_item.quantity,
                 ) for cart_item in cart_items
             ]
-
+            # the totals come with the INSERT, bulk_create doesn't send the signals that refresh them
+            order = Order.objects.create(
+                customer_id=customer_id,
+                item_count=sum(item.quantity for item in order_items),
+                total_price=sum(item.quantity * item.unit_price for item in order_items),
+            )
+            for order_item in order_items:
+                order_item.order = order
             OrderItem.objects.bulk_create(order_items)
 
-            Cart.objects.get(id=cart_id).delete()
+            Cart.objects.filter(id=cart_id).delete()
+
+            # queryset.update() skips post_save, only the cached catalog responses showing these inventories are stale
+            product_ids = [item.product_id for item in cart_items]
+            transaction.on_commit(lambda: bump_inventory_versions(product_ids))
 
             return order
 
@@ -210,4 +306,4 @@ class OrderForAdminSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'status', 'datetime_created', 'items']
+        fields = ['id', 'customer', 'status', 'datetime_created', 'item_count', 'total_price', 'items']
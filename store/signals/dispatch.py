@@ -0,0 +1,191 @@
+"""
+dispatch layer for the store signals.
+
+the mode comes from settings.SIGNAL_DISPATCH_MODE:
+    'outbox' - the payload is written to the SignalOutbox table and delivered
+               (at least once) by the process_signal_outbox management command
+    'thread' - receivers run in a background thread pool, handy for development
+    'sync'   - receivers run inline, like signal.send_robust()
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from store.models import SignalOutbox
+from . import order_created
+
+
+logger = logging.getLogger(__name__)
+
+SIGNALS = {
+    'order_created': order_created,
+}
+
+DISPATCH_MODE_OUTBOX = 'outbox'
+DISPATCH_MODE_THREAD = 'thread'
+DISPATCH_MODE_SYNC = 'sync'
+
+_executor = None
+
+
+def get_dispatch_mode():
+    return getattr(settings, 'SIGNAL_DISPATCH_MODE', DISPATCH_MODE_OUTBOX)
+
+
+def serialize_payload(kwargs):
+    """ model instances are stored as a reference and loaded again by the worker """
+    payload = {}
+    for key, value in kwargs.items():
+        if isinstance(value, models.Model):
+            value = {'__model__': value._meta.label_lower, 'pk': value.pk}
+        payload[key] = value
+    return payload
+
+
+def deserialize_payload(payload):
+    kwargs = {}
+    for key, value in payload.items():
+        if isinstance(value, dict) and '__model__' in value:
+            value = apps.get_model(value['__model__'])._default_manager.get(pk=value['pk'])
+        kwargs[key] = value
+    return kwargs
+
+
+def sender_path(sender):
+    return f'{sender.__module__}.{sender.__qualname__}'
+
+
+def _send_in_thread(signal, sender, kwargs):
+    try:
+        for receiver, response in signal.send_robust(sender, **kwargs):
+            if isinstance(response, Exception):
+                logger.error('receiver %r of %s failed: %r', receiver, sender, response)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SIGNAL_DISPATCH_THREADS', 4),
+            thread_name_prefix='signal-dispatch',
+        )
+    return _executor
+
+
+def dispatch_signal(name, sender, **kwargs):
+    """ hands the signal to the configured dispatch mode instead of running every receiver inline """
+    signal = SIGNALS[name]
+    mode = get_dispatch_mode()
+
+    if mode == DISPATCH_MODE_SYNC:
+        return signal.send_robust(sender, **kwargs)
+
+    if mode == DISPATCH_MODE_THREAD:
+        transaction.on_commit(lambda: get_executor().submit(_send_in_thread, signal, sender, kwargs))
+        return []
+
+    SignalOutbox.objects.create(signal=name, sender=sender_path(sender), payload=serialize_payload(kwargs))
+    return []
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'SIGNAL_OUTBOX_RETRY_BASE_SECONDS', 5)
+    cap = getattr(settings, 'SIGNAL_OUTBOX_RETRY_MAX_SECONDS', 60 * 60)
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)))
+
+
+def deliver(message):
+    """ runs every receiver of the message, returns the errors """
+    kwargs = deserialize_payload(message.payload)
+    sender = import_string(message.sender)
+    return [
+        f'{getattr(receiver, "__qualname__", receiver)}: {response!r}'
+        for receiver, response in SIGNALS[message.signal].send_robust(sender, **kwargs)
+        if isinstance(response, Exception)
+    ]
+
+
+def process_outbox_batch(batch_size=100, max_attempts=10):
+    """
+    claims a batch of due messages (SKIP LOCKED, so many workers can run side by side)
+    and delivers them inside the same transaction. when a worker dies mid-batch the rows
+    unlock and are delivered again, so receivers have to be idempotent.
+    returns (delivered, failed).
+    """
+    delivered = failed = 0
+    with transaction.atomic():
+        messages = list(
+            SignalOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, dead=False, available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        for message in messages:
+            try:
+                with transaction.atomic():
+                    errors = deliver(message)
+            except Exception as error:
+                errors = [repr(error)]
+
+            message.attempts += 1
+            if errors:
+                failed += 1
+                message.last_error = '\n'.join(errors)
+                message.available_at = timezone.now() + retry_delay(message.attempts)
+                message.dead = message.attempts >= max_attempts
+            else:
+                delivered += 1
+                message.processed_at = timezone.now()
+                message.last_error = ''
+
+        SignalOutbox.objects.bulk_update(
+            messages, ['attempts', 'last_error', 'available_at', 'dead', 'processed_at'],
+        )
+    return delivered, failed
+
+
+def purge_processed_outbox(older_than, batch_size=1000):
+    """ deletes delivered messages older than `older_than` (a timedelta) in bounded batches """
+    deleted = 0
+    cutoff = timezone.now() - older_than
+    while True:
+        ids = list(SignalOutbox.objects.filter(processed_at__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += SignalOutbox.objects.filter(pk__in=ids).delete()[0]
+
+
+def outbox_stats():
+    """ queue depth and lag of the outbox """
+    pending = SignalOutbox.objects.filter(processed_at__isnull=True, dead=False)
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'depth': pending.count(),
+        'dead': SignalOutbox.objects.filter(dead=True).count(),
+        'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+def outbox_metrics():
+    """ the outbox stats as prometheus gauges, listed in settings.METRICS_COLLECTORS """
+    stats = outbox_stats()
+    return [
+        '# HELP signal_outbox_depth Signals waiting to be delivered.',
+        '# TYPE signal_outbox_depth gauge',
+        f'signal_outbox_depth {stats["depth"]}',
+        '# HELP signal_outbox_dead Signals that ran out of delivery attempts.',
+        '# TYPE signal_outbox_dead gauge',
+        f'signal_outbox_dead {stats["dead"]}',
+        '# HELP signal_outbox_lag_seconds Age of the oldest signal waiting to be delivered.',
+        '# TYPE signal_outbox_lag_seconds gauge',
+        f'signal_outbox_lag_seconds {stats["lag_seconds"]:.3f}',
+    ]
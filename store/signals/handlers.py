@@ -1,11 +1,150 @@
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 
-from store.models import Customer
+from store.cache import bump_catalog_version
+from store.models import Customer, Category, Product, Discount, Cart, CartItem, Comment, Order, OrderItem
+from store.pricing import refresh_effective_prices
+
+PRICE_FIELDS = ['best_discount', 'effective_price', 'final_price']
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_profile_for_newly_created_user(sender, instance, created, **kwargs):
     if created:
         Customer.objects.create(user=instance)
-    
\ No newline at end of file
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product_state(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._previous_category_id = instance._previous_unit_price = None
+        return
+    previous = Product.objects.filter(pk=instance.pk)\
+        .values_list('category_id', 'unit_price').first()
+    instance._previous_category_id, instance._previous_unit_price = previous or (None, None)
+
+
+@receiver(post_save, sender=Product)
+def update_category_products_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if created:
+        Category.objects.filter(pk=instance.category_id).update(products_count=F('products_count') + 1)
+    elif previous_category_id is not None and previous_category_id != instance.category_id:
+        Category.objects.filter(pk=previous_category_id, products_count__gt=0)\
+            .update(products_count=F('products_count') - 1)
+        Category.objects.filter(pk=instance.category_id).update(products_count=F('products_count') + 1)
+
+
+@receiver(post_delete, sender=Product)
+def update_category_products_count_on_delete(sender, instance, **kwargs):
+    Category.objects.filter(pk=instance.category_id, products_count__gt=0)\
+        .update(products_count=F('products_count') - 1)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_previous_comment_status(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._previous_status = None
+        return
+    instance._previous_status = Comment.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def update_product_comments_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_approved = not created and getattr(instance, '_previous_status', None) == Comment.COMMENT_STATUS_APPROVED
+    is_approved = instance.status == Comment.COMMENT_STATUS_APPROVED
+    if is_approved and not was_approved:
+        Product.objects.filter(pk=instance.product_id).update(comments_count=F('comments_count') + 1)
+    elif was_approved and not is_approved:
+        Product.objects.filter(pk=instance.product_id, comments_count__gt=0)\
+            .update(comments_count=F('comments_count') - 1)
+
+
+@receiver(post_delete, sender=Comment)
+def update_product_comments_count_on_delete(sender, instance, origin=None, **kwargs):
+    # comments deleted together with their product have no counter left to update
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+    if instance.status == Comment.COMMENT_STATUS_APPROVED:
+        Product.objects.filter(pk=instance.product_id, comments_count__gt=0)\
+            .update(comments_count=F('comments_count') - 1)
+
+
+# the stored effective prices are refreshed before the catalog cache is invalidated,
+# receivers run in the order they are connected
+@receiver(post_save, sender=Product)
+def refresh_product_prices_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.unit_price != getattr(instance, '_previous_unit_price', None):
+        refresh_effective_prices(Product.objects.filter(pk=instance.pk))
+        instance.refresh_from_db(fields=PRICE_FIELDS)
+
+
+@receiver(post_save, sender=Discount)
+def refresh_product_prices_on_discount_save(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    refresh_effective_prices(Product.objects.filter(discounts=instance))
+
+
+@receiver(pre_delete, sender=Discount)
+def remember_discounted_products(sender, instance, **kwargs):
+    instance._product_ids = list(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Discount)
+def refresh_product_prices_on_discount_delete(sender, instance, **kwargs):
+    refresh_effective_prices(Product.objects.filter(pk__in=getattr(instance, '_product_ids', [])))
+
+
+@receiver(m2m_changed, sender=Product.discounts.through)
+def refresh_product_prices_on_discounts_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_product_ids = list(instance.product_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = getattr(instance, '_cleared_product_ids', [])
+    else:
+        product_ids = pk_set
+    refresh_effective_prices(Product.objects.filter(pk__in=product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(m2m_changed, sender=Product.discounts.through)
+def invalidate_catalog_cache(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def refresh_cart_totals_on_item_change(sender, instance, raw=False, origin=None, **kwargs):
+    # items deleted together with their cart (checkout, cart delete) have nothing left to refresh
+    if raw or isinstance(origin, Cart) or getattr(origin, 'model', None) is Cart:
+        return
+    Cart.refresh_totals(Cart.objects.filter(pk=instance.cart_id))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_totals_on_item_change(sender, instance, raw=False, **kwargs):
+    # checkout fills the totals itself, this covers later edits (admin inlines, shell)
+    if raw:
+        return
+    Order.refresh_totals(Order.objects.filter(pk=instance.order_id))
@@ -0,0 +1,95 @@
+"""
+sparse fieldsets: `?fields=id,name,price` keeps only these serializer fields, `?omit=description` drops some.
+
+SparseFieldsetMixin trims the serializer of GET requests (the compiled serializers of
+store.fast_serializers are built from it, so they are trimmed too) and narrows the SELECT
+with .only() to the columns behind the remaining fields. views ask is_field_requested()
+before adding a prefetch or select_related for a nested field.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+def get_field_columns(model, field):
+    """
+    the model fields .only() needs for a serializer field, [] for a reverse relation
+    (those come from a prefetch) and None when it can't be known (method fields, source='*').
+    """
+    if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+        return None
+    try:
+        model_field = model._meta.get_field(field.source_attrs[0])
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete:
+        return [] if model_field.is_relation else None
+    return [model_field.name]
+
+
+class SparseFieldsetMixin:
+    # model fields always loaded, e.g. the ones keyset pagination reads from the last row
+    sparse_required_fields = ()
+
+    def get_sparse_fieldset(self):
+        """ the requested top level field names, None when every field is requested """
+        if not hasattr(self, '_sparse_fieldset'):
+            self._sparse_fieldset = None
+            fields = _split(self.request.query_params.get(FIELDS_PARAM))
+            omit = _split(self.request.query_params.get(OMIT_PARAM))
+            if (fields or omit) and self.request.method in SAFE_METHODS:
+                available = list(self.get_serializer_class()().fields)
+                unknown = sorted(set(fields + omit) - set(available))
+                if unknown:
+                    raise ValidationError({FIELDS_PARAM: f'Unknown fields {unknown}, the fields are {available}.'})
+                self._sparse_fieldset = [
+                    name for name in available if (not fields or name in fields) and name not in omit
+                ]
+        return self._sparse_fieldset
+
+    def is_field_requested(self, name):
+        fieldset = self.get_sparse_fieldset()
+        return fieldset is None or name in fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_sparse_fieldset()
+        if fieldset is not None:
+            target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+            for name in list(target.fields):
+                if name not in fieldset:
+                    target.fields.pop(name)
+        return serializer
+
+    def get_sparse_columns(self, model):
+        columns = set(self.sparse_required_fields) | set(getattr(self, 'ordering_fields', None) or [])
+        for name, field in self.get_serializer_class()().fields.items():
+            if name not in self.get_sparse_fieldset():
+                continue
+            field_columns = get_field_columns(model, field)
+            if field_columns is None:
+                return None
+            columns.update(field_columns)
+        return columns
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_sparse_fieldset() is None or self.action not in ('list', 'retrieve'):
+            return queryset
+
+        columns = self.get_sparse_columns(queryset.model)
+        select_related = queryset.query.select_related
+        if columns is None or select_related is True:
+            return queryset
+        # relations followed by select_related can't be deferred
+        columns.update(select_related or {})
+        return queryset.only(*columns)
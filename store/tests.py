@@ -1,3 +1,638 @@
-from django.test import TestCase
+import json
+import threading
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
 
+from . import models
+from .cache import bump_catalog_version, get_catalog_cache
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    """ every registered changelist runs the same, bounded number of queries whatever its page size """
+    QUERY_BUDGET = 15
+    ROWS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+        category = models.Category.objects.create(title='category')
+        discount = models.Discount.objects.create(title='discount', discount=0.1, description='discount')
+        for i in range(cls.ROWS):
+            # the customer is created by store.signals.handlers
+            user = User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password', first_name=f'first{i}')
+            customer = user.customer
+            models.Address.objects.create(customer=customer, province='province', city='city', street='street')
+
+            other_category = models.Category.objects.create(title=f'category {i}')
+            product = models.Product.objects.create(
+                title=f'product {i}', slug=f'product-{i}', unit_price=10 + i, inventory=i, category=category,
+            )
+            product.discounts.add(discount)
+            other_category.top_product = product
+            other_category.save()
+            models.Comment.objects.create(user=user, product=product, body='body')
+
+            order = models.Order.objects.create(customer=customer)
+            models.OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=product.unit_price)
+            cart = models.Cart.objects.create()
+            models.CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def count_changelist_queries(self, model, model_admin, per_page):
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+        with mock.patch.object(model_admin, 'list_per_page', per_page), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_budget(self):
+        for model, model_admin in admin.site._registry.items():
+            with self.subTest(model=model.__name__):
+                small_page = self.count_changelist_queries(model, model_admin, per_page=2)
+                large_page = self.count_changelist_queries(model, model_admin, per_page=self.ROWS)
+                self.assertEqual(small_page, large_page, 'the changelist runs queries per row')
+                self.assertLessEqual(large_page, self.QUERY_BUDGET)
+
+
+class OrderCreatedOutboxTests(TestCase):
+    """ the order_created outbox row is written in the checkout transaction """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'password')
+        category = models.Category.objects.create(title='category')
+        cls.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+
+    def checkout(self):
+        return self.client.post('/store/orders/', {'cart_id': str(self.cart.pk)}, format='json')
+
+    def test_order_and_outbox_row_are_written_together(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        message = models.SignalOutbox.objects.get()
+        self.assertEqual(message.signal, 'order_created')
+        self.assertEqual(message.payload['order']['pk'], models.Order.objects.get().pk)
+
+    def test_failed_dispatch_rolls_the_order_back(self):
+        with mock.patch('store.views.dispatch_signal', side_effect=DatabaseError('outbox is down')), \
+                self.assertRaises(DatabaseError):
+            self.checkout()
+        self.assertFalse(models.Order.objects.exists())
+        self.assertTrue(models.Cart.objects.filter(pk=self.cart.pk).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+
+
+class ReapStaleCartsTests(TransactionTestCase):
+    # the command closes stale connections between batches, which a TestCase transaction doesn't survive
+
+    def setUp(self):
+        category = models.Category.objects.create(title='category')
+        self.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+
+    def create_cart(self, idle_days):
+        cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        models.Cart.objects.filter(pk=cart.pk).update(last_activity_at=timezone.now() - timedelta(days=idle_days))
+        return cart
+
+    def test_price_changes_do_not_keep_idle_carts_alive(self):
+        idle, active = self.create_cart(idle_days=40), self.create_cart(idle_days=1)
+        # repricing refreshes the totals and updated_at of every cart holding the product
+        self.product.unit_price = 20
+        self.product.save()
+
+        call_command('reap_stale_carts', ttl_days=30, stdout=StringIO())
+
+        self.assertFalse(models.Cart.objects.filter(pk=idle.pk).exists())
+        self.assertFalse(models.CartItem.objects.filter(cart_id=idle.pk).exists())
+        self.assertTrue(models.CartItem.objects.filter(cart_id=active.pk).exists())
+
+    def test_item_writes_mark_the_cart_active(self):
+        cart = self.create_cart(idle_days=40)
+        client = APIClient()
+        response = client.patch(f'/store/carts/{cart.pk}/items/{cart.items.get().pk}/', {'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        call_command('reap_stale_carts', ttl_days=30, stdout=StringIO())
+        self.assertTrue(models.Cart.objects.filter(pk=cart.pk).exists())
+
+
+class ProductLastModifiedTests(TestCase):
+    """ stored price refreshes move the Last-Modified of the product """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(title='category')
+        cls.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=100, inventory=5, category=category,
+        )
+
+    def test_discount_change_invalidates_if_modified_since(self):
+        url = f'/store/products/{self.product.pk}/'
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # Last-Modified has a one second resolution
+        models.Product.objects.filter(pk=self.product.pk)\
+            .update(datetime_modified=timezone.now() - timedelta(seconds=5))
+        last_modified = self.client.get(url)['Last-Modified']
+        self.product.discounts.add(models.Discount.objects.create(title='sale', discount=0.5, description='sale'))
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['discount'], 0.5)
+
+
+class KeysetPaginationTests(TestCase):
+    """ cursors walk the product list and a bad cursor is a 404, not a 500 """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(title='category')
+        for i in range(15):
+            models.Product.objects.create(
+                title=f'product {i}', slug=f'product-{i}', unit_price=10 + i % 5, inventory=1, category=category,
+            )
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def cursor(self, *values):
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def test_pages_cover_every_product_once(self):
+        page = self.get_page('/store/products/?pagination=cursor&ordering=unit_price')
+        ids = [product['id'] for product in page['results']]
+        page = self.get_page(page['next'])
+        ids += [product['id'] for product in page['results']]
+        self.assertIsNone(page['next'])
+        self.assertCountEqual(ids, models.Product.objects.values_list('pk', flat=True))
+
+        previous = self.get_page(page['previous'])
+        self.assertEqual([product['id'] for product in previous['results']], ids[:10])
+
+    def test_invalid_cursors_are_not_found(self):
+        cursors = [
+            'not-base64!',
+            self.cursor('unit_price', '10.00', 1),
+            self.cursor('unit_price', 'ten', 1, 0),
+            self.cursor('unit_price', '10.00', 'one', 0),
+            # a unit_price cursor replayed with the default datetime_created ordering
+            self.cursor('unit_price', '10.00', 1, 0),
+        ]
+        for i, cursor in enumerate(cursors):
+            ordering = '&ordering=unit_price' if i < len(cursors) - 1 else ''
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/store/products/?cursor={cursor}{ordering}')
+                self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchVectorTests(TestCase):
+    """ the stored tsvector never leaves the database """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(title='category')
+        cls.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=1, category=category,
+        )
+
+    def test_product_reads_do_not_select_search_vector(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/store/products/').status_code, 200)
+            self.assertEqual(self.client.get(f'/store/products/{self.product.pk}/').status_code, 200)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertNotIn('search_vector', sql.split(' FROM ')[0])
+
+
+class RebuildCategoryCountersTests(TestCase):
+    """ the command is discovered by manage.py and repairs drifted counters """
+
+    def test_drifted_counters_are_rebuilt(self):
+        category, empty = models.Category.objects.create(title='category'), models.Category.objects.create(title='empty')
+        for i in range(3):
+            models.Product.objects.create(title=f'product {i}', slug=f'product-{i}', unit_price=10, inventory=1,
+                                          category=category)
+        models.Category.objects.update(products_count=7)
+
+        out = StringIO()
+        call_command('rebuild_category_counters', stdout=out)
+
+        self.assertIn('2 categories', out.getvalue())
+        self.assertEqual(models.Category.objects.get(pk=category.pk).products_count, 3)
+        self.assertEqual(models.Category.objects.get(pk=empty.pk).products_count, 0)
+
+
+class IdempotencyKeyTests(TestCase):
+    """ POST /orders/ with an Idempotency-Key header """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'password')
+        category = models.Category.objects.create(title='category')
+        cls.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+
+    def checkout(self, key, cart_id=None):
+        return self.client.post('/store/orders/', {'cart_id': str(cart_id or self.cart.pk)}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.checkout('key-1')
+        retry = self.checkout('key-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(models.Order.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.assertEqual(self.checkout('key-1').status_code, 201)
+        other_cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=other_cart, product=self.product, quantity=1)
+
+        response = self.checkout('key-1', cart_id=other_cart.pk)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(models.Order.objects.count(), 1)
+        self.assertTrue(models.Cart.objects.filter(pk=other_cart.pk).exists())
+
+    def test_purge_deletes_expired_keys_only(self):
+        other_cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=other_cart, product=self.product, quantity=1)
+        self.checkout('key-1')
+        self.checkout('key-2', cart_id=other_cart.pk)
+        models.IdempotencyKey.objects.filter(key='key-1').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', batch_size=1, stdout=out)
+        self.assertIn('deleted 1 expired', out.getvalue())
+        self.assertEqual(list(models.IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+
+
+class IdempotencyKeyConcurrencyTests(TransactionTestCase):
+    # the requests run in their own threads and connections, so the test can't hold a transaction
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'password')
+        category = models.Category.objects.create(title='category')
+        product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def checkout(self, responses):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            responses.append(client.post('/store/orders/', {'cart_id': str(self.cart.pk)}, format='json',
+                                         HTTP_IDEMPOTENCY_KEY='key-1'))
+        finally:
+            connection.close()
+
+    def test_concurrent_duplicate_waits_and_replays(self):
+        from .views import OrderViewSet
+
+        entered, release = threading.Event(), threading.Event()
+        create_order = OrderViewSet.create_order
+
+        def slow_create_order(view, request, *args, **kwargs):
+            # holds the first request inside its transaction, after the key row is inserted
+            entered.set()
+            release.wait(timeout=10)
+            return create_order(view, request, *args, **kwargs)
+
+        responses = []
+        with mock.patch.object(OrderViewSet, 'create_order', slow_create_order):
+            first = threading.Thread(target=self.checkout, args=(responses,))
+            first.start()
+            self.assertTrue(entered.wait(timeout=10))
+            duplicate = threading.Thread(target=self.checkout, args=(responses,))
+            duplicate.start()
+            # the duplicate blocks on the unique index of the uncommitted key row
+            duplicate.join(timeout=0.5)
+            self.assertTrue(duplicate.is_alive())
+            release.set()
+            first.join(timeout=10)
+            duplicate.join(timeout=10)
+
+        # the replay may finish before the first request is done with its on_commit callbacks
+        replayed = [response for response in responses if response.has_header('Idempotent-Replayed')]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(len(replayed), 1)
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual(models.Order.objects.count(), 1)
+
+
+class OrderExportTests(TestCase):
+    """ GET /orders/export/ writes one row per order item and keeps the orders without items """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        customer = User.objects.create_user('buyer', 'buyer@example.com', 'password').customer
+        category = models.Category.objects.create(title='category')
+        products = [
+            models.Product.objects.create(title=f'product {i}', slug=f'product-{i}', unit_price=10, inventory=5,
+                                          category=category)
+            for i in range(2)
+        ]
+        cls.order = models.Order.objects.create(customer=customer)
+        models.OrderItem.objects.create(order=cls.order, product=products[0], quantity=2, unit_price=10)
+        models.OrderItem.objects.create(order=cls.order, product=products[1], quantity=1, unit_price=9)
+        cls.empty_order = models.Order.objects.create(customer=customer)
+
+    def test_orders_without_items_are_exported(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/store/orders/export/?export_format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual([row['order_id'] for row in rows], [self.order.pk, self.order.pk, self.empty_order.pk])
+        self.assertEqual([row['quantity'] for row in rows], [2, 1, None])
+        self.assertEqual(rows[0]['product_title'], 'product 0')
+
+
+class CheckoutTests(TestCase):
+    """ POST /orders/ locks the cart and its products and never oversells """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'password')
+        category = models.Category.objects.create(title='category')
+        cls.products = [
+            models.Product.objects.create(title=f'product {i}', slug=f'product-{i}', unit_price=10, inventory=5,
+                                          category=category)
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = models.Cart.objects.create()
+
+    def checkout(self):
+        return self.client.post('/store/orders/', {'cart_id': str(self.cart.pk)}, format='json')
+
+    def assertNothingWritten(self):
+        self.assertFalse(models.Order.objects.exists())
+        self.assertTrue(models.Cart.objects.filter(pk=self.cart.pk).exists())
+        self.assertEqual([product.inventory for product in models.Product.objects.order_by('pk')], [5, 5])
+
+    def test_checkout_takes_the_inventory(self):
+        models.CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        models.CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=5)
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([product.inventory for product in models.Product.objects.order_by('pk')], [3, 0])
+        self.assertFalse(models.Cart.objects.filter(pk=self.cart.pk).exists())
+        order = models.Order.objects.get()
+        self.assertEqual((order.item_count, order.items.count()), (7, 2))
+
+    def test_oversell_is_rejected(self):
+        models.CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        models.CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=6)
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.products[1].pk), response.json()['cart_id'])
+        self.assertNothingWritten()
+
+    def test_empty_cart_is_rejected(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('empty', response.json()['cart_id'])
+        self.assertNothingWritten()
+
+    def test_inventory_guard_rolls_back_a_partial_update(self):
+        models.CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        models.CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=2)
+        filter_products = models.Product.objects.filter
+
+        def drained_filter(*args, **kwargs):
+            # as if another writer took the second product's stock between the check and the UPDATE
+            return filter_products(*args, **kwargs).exclude(pk=self.products[1].pk)
+
+        with mock.patch.object(models.Product.objects, 'filter', side_effect=drained_filter):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('some products', response.json()['cart_id'])
+        self.assertNothingWritten()
+
+
+class BenchmarkSerializersTests(TestCase):
+    """ the compiled serializers render the same bytes as the DRF ones """
+
+    def test_compiled_output_is_byte_identical(self):
+        customer = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'password').customer
+        category = models.Category.objects.create(title='category')
+        discount = models.Discount.objects.create(title='sale', discount=0.25, description='sale')
+        product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+        product.discounts.add(discount)
+        order = models.Order.objects.create(customer=customer)
+        models.OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=7.5)
+        cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=cart, product=product, quantity=3)
+
+        out = StringIO()
+        call_command('benchmark_serializers', rows=10, repeat=1, stdout=out)
+        self.assertEqual(out.getvalue().count('byte-identical'), 3)
+
+
+class CartItemUpsertTests(TestCase):
+    """ POST /carts/<id>/items/batch/ adds to or replaces the quantities in one statement """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(title='category')
+        cls.products = [
+            models.Product.objects.create(title=f'product {i}', slug=f'product-{i}', unit_price=10, inventory=5,
+                                          category=category)
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=3)
+
+    def batch(self, items, **data):
+        return self.client.post(f'/store/carts/{self.cart.pk}/items/batch/', {'items': items, **data},
+                                content_type='application/json')
+
+    def quantities(self):
+        return dict(models.CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def test_add_mode_adds_to_existing_quantities(self):
+        response = self.batch([{'product': self.products[0].pk, 'quantity': 2},
+                               {'product': self.products[1].pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.products[0].pk: 5, self.products[1].pk: 1})
+        self.assertEqual(models.Cart.objects.get(pk=self.cart.pk).item_count, 6)
+
+    def test_set_mode_replaces_existing_quantities(self):
+        response = self.batch([{'product': self.products[0].pk, 'quantity': 2}], mode='set')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.products[0].pk: 2})
+
+    def test_add_mode_caps_the_sum_at_the_column_maximum(self):
+        response = self.batch([{'product': self.products[0].pk, 'quantity': 32767}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.products[0].pk: 32767})
+
+    def test_duplicate_entries_past_the_maximum_are_rejected(self):
+        entry = {'product': self.products[1].pk, 'quantity': 20000}
+        response = self.batch([entry, entry])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.products[0].pk: 3})
+
+
+class CatalogVersionTests(TestCase):
+    """ a catalog bump made by one worker process changes the ETags every worker hands out """
+
+    def setUp(self):
+        models.Category.objects.create(title='category')
+
+    def get(self, cache, **headers):
+        with mock.patch('store.cache.get_catalog_cache', return_value=cache):
+            return self.client.get('/store/categories/', **headers)
+
+    def test_bump_is_seen_through_another_cache_instance(self):
+        # one cache connection per worker process
+        worker, other_worker = caches.create_connection('shared'), caches.create_connection('shared')
+        etag = self.get(worker)['ETag']
+        self.assertEqual(self.get(worker, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with mock.patch('store.cache.get_catalog_cache', return_value=other_worker):
+            bump_catalog_version()
+
+        response = self.get(worker, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CATALOG_CACHE_ALIAS='default')
+    def test_process_local_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_catalog_cache()
+
+
+class CatalogResponseCacheTests(TestCase):
+    """ catalog writes handled by one worker process invalidate the responses cached by the others """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        category = models.Category.objects.create(title='category')
+        cls.product = models.Product.objects.create(
+            title='product', slug='product', unit_price=10, inventory=5, category=category,
+        )
+
+    def setUp(self):
+        # one cache connection per worker process
+        self.worker, self.other_worker = caches.create_connection('shared'), caches.create_connection('shared')
+
+    def on(self, cache):
+        return mock.patch('store.cache.get_catalog_cache', return_value=cache)
+
+    def get_product(self):
+        with self.on(self.worker):
+            return APIClient().get(f'/store/products/{self.product.pk}/')
+
+    def test_product_edit_reaches_every_worker(self):
+        self.get_product()
+        self.assertEqual(self.get_product()['X-Cache'], 'HIT')
+
+        with self.on(self.other_worker):
+            self.product.unit_price = 20
+            self.product.save()
+
+        response = self.get_product()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['price'], 20)
+
+    def test_clear_inventory_reaches_every_worker(self):
+        self.get_product()
+        self.client.force_login(self.superuser)
+        with self.on(self.other_worker):
+            self.client.post(reverse('admin:store_product_changelist'),
+                             {'action': 'clear_inventory', '_selected_action': [self.product.pk]})
+
+        response = self.get_product()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['inventory'], 0)
+
+    def test_checkout_only_invalidates_the_responses_showing_its_inventory(self):
+        other = models.Product.objects.create(
+            title='other', slug='other', unit_price=10, inventory=5, category=self.product.category,
+        )
+        urls = [
+            f'/store/products/{self.product.pk}/',
+            f'/store/products/{other.pk}/',
+            '/store/products/?omit=inventory',
+            '/store/products/',
+            '/store/products/?ordering=inventory',
+        ]
+        with self.on(self.worker):
+            for url in urls:
+                APIClient().get(url)
+            etag = self.client.get('/store/categories/')['ETag']
+
+        cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        client = APIClient()
+        client.force_authenticate(self.superuser)
+        with self.on(self.other_worker), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json').status_code, 201)
+
+        with self.on(self.worker):
+            cached = [APIClient().get(url)['X-Cache'] for url in urls]
+            self.assertEqual(self.client.get('/store/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            inventory = APIClient().get(f'/store/products/{self.product.pk}/').json()['inventory']
+        self.assertEqual(cached, ['MISS', 'HIT', 'HIT', 'MISS', 'MISS'])
+        self.assertEqual(inventory, 3)
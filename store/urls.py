@@ -10,6 +10,7 @@ router.register('categories', views.CategoryViewSet, basename='category')
 router.register('carts',views.CartViewSet, basename='cart')
 router.register('customers', views.CustomerViewset, basename='customer')
 router.register('orders', views.OrderViewSet, basename='order')
+router.register('comments', views.CommentModerationViewSet, basename='comment-moderation')
 
 products_router = routers.NestedDefaultRouter(router, 'products', lookup='product')
 products_router.register('comments', views.CommentViewSet, basename='comment')
@@ -1,43 +1,61 @@
+from contextlib import contextmanager
+
 from django.shortcuts import render
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
+from django.db.models import Prefetch, Q
 from django.db import transaction
 
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny, SAFE_METHODS
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.decorators import action
 
 from rest_framework.viewsets import ModelViewSet
 
-from .filters import ProductFilter
-from .permissions import IsAdminOrReadOnly, SendPrivateEmailToCustomerPermission, CustomDjangoModelPermissions
+from .cache import CatalogCacheMixin, CatalogConditionalGetMixin, ConditionalGetMixin, get_catalog_cache_stats
+from .exports import EXPORT_CHUNK_SIZE, export_response
+from .fast_serializers import FastListMixin, FastRetrieveMixin
+from .filters import OrderFilter, ProductFilter, ProductSearchFilter
+from .idempotency import IdempotencyMixin
+from .sparse_fields import SparseFieldsetMixin
+from .permissions import IsAdminOrReadOnly, IsOwnerOrAdmin, SendPrivateEmailToCustomerPermission, CustomDjangoModelPermissions
 from .models import Product, Category, Comment, Cart, CartItem, Customer, Order, OrderItem
-from .serializers import ProductSerializer , CategorySerializer, CommentSerializer, CartSerilizer, CartItemSerializer,CustomerSerializer, OrderSerializer,AddCartItemSerializer,UpdateCartItemSerializer,OrderCreateSerializer, OrderUpdateSerializer, OrderForAdminSerializer
-from .paginations import DefaultPagination
-from .signals import order_created
+from .serializers import ProductSerializer , CategorySerializer, CommentSerializer, CartSerilizer, CartItemSerializer,CustomerSerializer, OrderSerializer,AddCartItemSerializer,UpdateCartItemSerializer,OrderCreateSerializer, OrderUpdateSerializer, OrderForAdminSerializer, BatchCartItemSerializer, CartSummarySerializer, CommentModerationSerializer
+from .paginations import KeysetPagination, OptionalKeysetPagination, ProductPagination
+from .signals.dispatch import dispatch_signal
 
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CatalogConditionalGetMixin, CatalogCacheMixin, SparseFieldsetMixin, FastListMixin, FastRetrieveMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
-    filter_backends = [DjangoFilterBackend,SearchFilter,OrderingFilter]
+    filter_backends = [DjangoFilterBackend,ProductSearchFilter,OrderingFilter]
     # filterset_fields = ['category','title','slug',]
-    ordering_fields = ['name', 'unit_price', 'inventory']
+    ordering_fields = ['unit_price', 'final_price', 'inventory', 'datetime_created']
     filterset_class = ProductFilter
-    search_fields = ['title',]
+    search_fields = ['title', 'description']
+    catalog_inventory_fields = ['inventory']
 
-    pagination_class = DefaultPagination
+    pagination_class = ProductPagination
     permission_classes = [IsAdminOrReadOnly]
 
     def get_serializer_context(self):
         return {'request': self.request}
+
+    def get_last_modified(self, request):
+        if self.action != 'retrieve':
+            return None
+        try:
+            return Product.objects.filter(pk=self.kwargs['pk']).values_list('datetime_modified', flat=True).first()
+        except (ValueError, DjangoValidationError):
+            return None
     
 
     def destroy(self, request, pk):
@@ -48,16 +66,29 @@ class ProductViewSet(ModelViewSet):
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(get_catalog_cache_stats())
+
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        header = ['id', 'title', 'slug', 'unit_price', 'best_discount', 'final_price', 'category_id', 'inventory', 'description',
+                  'datetime_created', 'datetime_modified']
+        rows = self.filter_queryset(self.get_queryset())\
+            .values_list(*header)\
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return export_response(request, 'products', header, rows)
 
-class CategoryViewSet(ModelViewSet):
+
+class CategoryViewSet(CatalogConditionalGetMixin, ModelViewSet):
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
 
     permission_classes = [IsAdminOrReadOnly, ]
 
     def destroy(self, request, pk):
-        category = get_object_or_404(Category.objects.prefetch_related('products'), pk=pk)
-        if category.products.count() > 0:
+        category = get_object_or_404(Category, pk=pk)
+        if category.products.exists():
             return Response({'error': 'There is some products relating this category. Please remove them first.'}, 
             status=status.HTTP_405_METHOD_NOT_ALLOWED)
         category.delete()
@@ -66,33 +97,39 @@ class CategoryViewSet(ModelViewSet):
 
 class CommentViewSet(ModelViewSet):
     serializer_class = CommentSerializer
+    # newest first, a page costs the same however many comments the product has
+    pagination_class = KeysetPagination
+    # ownership is checked on the comment get_object() already fetched
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
 
     def get_queryset(self):
         product_pk = self.kwargs.get('product_pk')
+        queryset = Comment.objects.filter(product_id=product_pk)
         if self.request.user.is_staff:
-            return Comment.objects.filter(product_id=product_pk).all()
-        return Comment.objects.filter(product_id=product_pk, status='a').all()
+            return queryset.all()
+        if self.request.method not in SAFE_METHODS:
+            # owners can still edit or delete their comments waiting for moderation
+            return queryset.filter(Q(status=Comment.COMMENT_STATUS_APPROVED) | Q(user_id=self.request.user.id))
+        return queryset.filter(status=Comment.COMMENT_STATUS_APPROVED).all()
 
     def get_serializer_context(self):
         return {'product_pk': self.kwargs.get('product_pk'),'user_id':self.request.user.id}
-    
-    def get_permissions(self):
-        if self.request.method in ['PUT','PATCH', 'DELETE']:
-            try:
-                comment = Comment.objects.get(pk=self.kwargs.get('pk'))
-            except Comment.DoesNotExist:
-                return [IsAdminUser()]
 
-            if not self.request.user == Comment.objects.get(pk=self.kwargs.get('pk')).user_id:
-                return [IsAdminUser()]
-            # return [IsAuthenticated()]
 
-        if self.request.method in ['POST']:    
-            return [IsAuthenticated()]
+class CommentModerationViewSet(GenericViewSet):
+    queryset = Comment.objects.all()
+    serializer_class = CommentModerationSerializer
+    permission_classes = [IsAdminUser]
 
-        return [IsAuthenticated()]
+    @action(detail=False, methods=['POST'])
+    def moderate(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
 
-class CartViewSet(CreateModelMixin,
+class CartViewSet(ConditionalGetMixin,
+                   FastRetrieveMixin,
+                   CreateModelMixin,
                    RetrieveModelMixin,
                    DestroyModelMixin,
                    GenericViewSet):
@@ -101,9 +138,41 @@ class CartViewSet(CreateModelMixin,
         queryset=CartItem.objects.select_related('product')
     )).all()
     serializer_class = CartSerilizer
+    conditional_actions = ('retrieve', 'summary')
+
+    def get_cart_state(self):
+        # one indexed lookup gives the validators and the whole summary
+        if not hasattr(self, '_cart_state'):
+            try:
+                self._cart_state = Cart.objects.filter(pk=self.kwargs['pk'])\
+                    .values('id', 'item_count', 'total_price', 'updated_at').first()
+            except DjangoValidationError:
+                self._cart_state = None
+        return self._cart_state
+
+    def get_last_modified(self, request):
+        cart_state = self.get_cart_state()
+        return cart_state['updated_at'] if cart_state else None
+
+    def get_etag(self, request):
+        updated_at = self.get_last_modified(request)
+        return f'{self.action}-{self.kwargs["pk"]}-{updated_at.timestamp()}' if updated_at else None
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+    @action(detail=True)
+    def summary(self, request, pk):
+        return self.conditional_response(request, self.get_summary)
 
+    def get_summary(self, request):
+        cart_state = self.get_cart_state()
+        if cart_state is None:
+            raise NotFound()
+        return Response(CartSummarySerializer(cart_state).data)
 
-class CartItemViewSet(ModelViewSet):
+
+class CartItemViewSet(IdempotencyMixin, ModelViewSet):
     http_method_names = ['get','post','patch','delete']
 
     def get_queryset(self):
@@ -112,7 +181,36 @@ class CartItemViewSet(ModelViewSet):
 
     def get_serializer_context(self):
         return {'cart_pk': self.kwargs['cart_pk']}
-    
+
+    def get_idempotency_scope(self, request):
+        return f'cart-items:{self.kwargs["cart_pk"]}'
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent_response(request, super().create, *args, **kwargs)
+
+    @contextmanager
+    def locked_cart(self):
+        """ item writes lock the cart row, so Cart.refresh_totals() sees every committed change """
+        with transaction.atomic():
+            try:
+                cart_pk = Cart.lock(self.kwargs['cart_pk'])
+            except DjangoValidationError:
+                cart_pk = None
+            if cart_pk is None:
+                raise NotFound('There is no cart with this cart id!')
+            yield
+
+    def perform_create(self, serializer):
+        with self.locked_cart():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with self.locked_cart():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with self.locked_cart():
+            instance.delete()
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -121,17 +219,28 @@ class CartItemViewSet(ModelViewSet):
             return UpdateCartItemSerializer
         return CartItemSerializer
 
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, cart_pk):
+        serializer = BatchCartItemSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        with self.locked_cart():
+            cart_items = serializer.save()
+        return Response(
+            [{'id': item.id, 'product': item.product_id, 'quantity': item.quantity} for item in cart_items],
+            status=status.HTTP_200_OK,
+        )
+
 
 
-class CustomerViewset(ModelViewSet):
+class CustomerViewset(SparseFieldsetMixin, ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
 
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        user_id = request.user.id
-        customer = Customer.objects.get(user_id=user_id)
+        # attached by core.authentication, no query
+        customer = request.user.customer
 
         if request.method == 'GET':
             serializer = CustomerSerializer(customer)
@@ -148,25 +257,38 @@ class CustomerViewset(ModelViewSet):
 
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(IdempotencyMixin, SparseFieldsetMixin, FastListMixin, FastRetrieveMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'options', 'head']
+    pagination_class = OptionalKeysetPagination
+    # read by the keyset pagination cursor
+    sparse_required_fields = ('datetime_created',)
+
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = OrderFilter
+    ordering_fields = ['datetime_created', 'total_price']
 
     def get_permissions(self):
-        if self.request.method in ['PUT', 'PATCH']:
+        if self.request.method in ['PUT', 'PATCH'] or self.action == 'export':
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    def get_idempotency_scope(self, request):
+        return f'orders:{request.user.pk}'
+
     def get_queryset(self):
-        queryset = Order.objects.prefetch_related(
-            Prefetch(
+        queryset = Order.objects.all()
+        user = self.request.user
+
+        # nested fields left out with ?fields= / ?omit= are not loaded at all
+        if self.is_field_requested('items'):
+            queryset = queryset.prefetch_related(Prefetch(
                 'items',
                 queryset=OrderItem.objects.select_related('product'),
-            )
-        ).select_related('customer__user').all()
-
-        user = self.request.user
+            ))
 
         if user.is_staff:
+            if self.is_field_requested('customer'):
+                queryset = queryset.select_related('customer__user')
             return queryset
         return queryset.filter(customer__user_id = user.id)
     
@@ -182,16 +304,35 @@ class OrderViewSet(ModelViewSet):
 
         return OrderSerializer
 
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        # one row per order item, orders are filtered exactly like the list view.
+        # the items are LEFT JOINed, an order without items is one row with empty item columns
+        orders = self.filter_queryset(self.get_queryset())
+        header = ['order_id', 'customer_id', 'status', 'datetime_created',
+                  'product_id', 'product_title', 'quantity', 'unit_price']
+        rows = orders\
+            .prefetch_related(None)\
+            .order_by('id', 'items__id')\
+            .values_list('id', 'customer_id', 'status', 'datetime_created',
+                         'items__product_id', 'items__product__title', 'items__quantity', 'items__unit_price')\
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return export_response(request, 'orders', header, rows)
+
     def create(self, request, *args, **kwargs):
+        return self.idempotent_response(request, self.create_order, *args, **kwargs)
+
+    def create_order(self, request, *args, **kwargs):
          create_order_serializer = OrderCreateSerializer(
             data=request.data,
-            context={'user_id': self.request.user.id},
+            context={'user_id': self.request.user.id, 'customer_id': self.request.user.customer.pk},
         )
         
          create_order_serializer.is_valid(raise_exception=True)
-         created_order = create_order_serializer.save()
-
-         order_created.send_robust(self.__class__, order=created_order)
+         # the outbox row commits (or rolls back) together with the order
+         with transaction.atomic():
+             created_order = create_order_serializer.save()
+             dispatch_signal('order_created', self.__class__, order=created_order)
 
          serializer = OrderSerializer(created_order)
          return Response(serializer.data, status=status.HTTP_201_CREATED)